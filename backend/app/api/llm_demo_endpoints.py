@@ -3,13 +3,18 @@
 """
 
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, AsyncIterator, List, Optional
+import asyncio
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 import logging
 
+import orjson
+
 from app.services.real_llm_service import RealLLMService
+from app.services.session_store import TTLSessionStore
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
@@ -17,7 +22,8 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/demo", tags=["llm-demo"])
 
 # グローバルなセッション管理（実際のプロダクションではRedis等を使用）
-demo_sessions: Dict[str, Dict[str, Any]] = {}
+# LRU + TTL で上限を設け、アイドルセッションを自動的に破棄する
+demo_sessions: TTLSessionStore = TTLSessionStore()
 
 
 class StartDemoRequest(BaseModel):
@@ -51,12 +57,25 @@ class SendMessageResponse(BaseModel):
     sentiment_analysis: Optional[Dict[str, Any]] = None
 
 
+class StreamActionPlanRequest(BaseModel):
+    session_id: str
+
+
+# プロバイダーごとのLLMサービス（クライアントやパーサーをリクエストごとに再構築しない）
+_llm_services: Dict[str, RealLLMService] = {}
+
+
 def get_llm_service(provider: str = "openai") -> RealLLMService:
     """LLMサービスのDI"""
+    service = _llm_services.get(provider)
+    if service is not None:
+        return service
     try:
-        return RealLLMService(provider=provider)
+        service = RealLLMService(provider=provider)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"LLMサービス初期化エラー: {str(e)}")
+    _llm_services[provider] = service
+    return service
 
 
 @router.post("/start", response_model=StartDemoResponse)
@@ -71,24 +90,25 @@ async def start_demo_session(request: StartDemoRequest):
             "user_name": request.user_name,
             "department": request.department,
             "experience_years": request.experience_years,
-            "topic": request.initial_topic,
-            "session_started": datetime.utcnow().isoformat()
+            "topic": request.initial_topic
         }
         
         # LLMサービス初期化
         llm_service = get_llm_service(request.llm_provider)
         
-        # 初期質問生成
+        # 初期質問生成（開始時刻はLLM入力に含めず、同一条件での生成結果を再利用可能にする）
         logger.info(f"Generating initial questions for session {session_id}")
         question_response = await llm_service.generate_initial_questions(initial_context)
+        now_iso = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        initial_context["session_started"] = now_iso
         
         # セッション情報を保存
         demo_sessions[session_id] = {
             "initial_context": initial_context,
             "conversation_history": [],
             "llm_provider": request.llm_provider,
-            "created_at": datetime.utcnow().isoformat(),
-            "last_activity": datetime.utcnow().isoformat()
+            "created_at": now_iso,
+            "last_activity": now_iso
         }
         
         logger.info(f"Demo session {session_id} started successfully")
@@ -117,26 +137,28 @@ async def send_demo_message(request: SendMessageRequest):
         
         session = demo_sessions[request.session_id]
         
-        # 会話履歴に追加
+        # 会話履歴に追加（このターンの記録は同一の時刻で揃える）
+        now_iso = datetime.now(timezone.utc).isoformat(timespec="seconds")
         session["conversation_history"].append({
             "role": "user",
             "content": request.message,
-            "timestamp": datetime.utcnow().isoformat()
+            "timestamp": now_iso
         })
-        session["last_activity"] = datetime.utcnow().isoformat()
+        session["last_activity"] = now_iso
         
         # LLMサービス取得
         llm_service = get_llm_service(session["llm_provider"])
         
-        # 感情分析
-        logger.info(f"Analyzing sentiment for session {request.session_id}")
-        sentiment_analysis = await llm_service.analyze_conversation_sentiment(request.message)
-        
-        # 情報充足度評価
-        logger.info(f"Evaluating completeness for session {request.session_id}")
-        completeness_score = await llm_service.evaluate_information_completeness(
-            session["conversation_history"]
+        # 感情分析と、充足度評価＋フォローアップ質問生成（1回のLLM呼び出し）を並行実行
+        logger.info(
+            "Analyzing sentiment and evaluating completeness for session "
+            f"{request.session_id}"
         )
+        sentiment_analysis, follow_up = await asyncio.gather(
+            llm_service.analyze_conversation_sentiment(request.message),
+            llm_service.assess_and_generate_follow_up(session["conversation_history"])
+        )
+        completeness_score = follow_up.completeness_score
         
         # 80%以上の場合はアクションプラン生成
         if completeness_score >= 80:
@@ -148,7 +170,7 @@ async def send_demo_message(request: SendMessageRequest):
             # アクションプランをセッションに保存
             session["action_plan"] = {
                 "plan": action_plan.dict(),
-                "generated_at": datetime.utcnow().isoformat()
+                "generated_at": now_iso
             }
             
             return SendMessageResponse(
@@ -159,13 +181,7 @@ async def send_demo_message(request: SendMessageRequest):
             )
         
         else:
-            # フォローアップ質問生成
-            logger.info(f"Generating follow-up questions for session {request.session_id}")
-            follow_up = await llm_service.generate_follow_up_questions(
-                session["conversation_history"],
-                completeness_score
-            )
-            
+            # 評価と同時に生成済みのフォローアップ質問を返す
             return SendMessageResponse(
                 type="follow_up",
                 questions=follow_up.questions,
@@ -181,6 +197,39 @@ async def send_demo_message(request: SendMessageRequest):
         raise HTTPException(status_code=500, detail=f"メッセージ処理エラー: {str(e)}")
 
 
+@router.post("/action-plan/stream")
+async def stream_demo_action_plan(request: StreamActionPlanRequest):
+    """アクションプランのストリーミング生成（Server-Sent Events）
+    
+    生成中のテキストを delta イベントとして逐次送信し、アクションアイテムが1件完成するごとに
+    partial イベントで完成分を、完了時に action_plan イベントでパース済みのプランを送信する。
+    フロントエンドは最初のトークンから描画を開始できる。
+    """
+    if request.session_id not in demo_sessions:
+        raise HTTPException(status_code=404, detail="セッションが見つかりません")
+    
+    session = demo_sessions[request.session_id]
+    llm_service = get_llm_service(session["llm_provider"])
+    
+    async def event_stream() -> AsyncIterator[bytes]:
+        try:
+            async for event in llm_service.stream_action_plan(session["conversation_history"]):
+                if event["type"] == "action_plan":
+                    plan = event["data"].dict()
+                    session["action_plan"] = {
+                        "plan": plan,
+                        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds")
+                    }
+                    event = {"type": "action_plan", "data": plan}
+                yield b"data: " + orjson.dumps(event) + b"\n\n"
+        except Exception as e:
+            logger.error(f"Error streaming action plan: {str(e)}")
+            error = {"type": "error", "detail": f"アクションプラン生成エラー: {str(e)}"}
+            yield b"data: " + orjson.dumps(error) + b"\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
 @router.get("/session/{session_id}")
 async def get_demo_session(session_id: str):
     """デモセッション情報取得"""
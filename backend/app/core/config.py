@@ -24,12 +24,22 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
     
+    # Session
+    MAX_SESSIONS: int = 10000  # インメモリセッションの最大保持数
+    SESSION_TTL_SECONDS: int = 86400  # 24時間アクセスがないセッションは破棄
+    
     # LLM設定
     USE_MOCK_LLM: bool = False  # 実際のLLMを使用
+    # バッチキューごとに同時に発行するLLM呼び出しの上限（レート制限対策）
+    LLM_MAX_CONCURRENCY: int = 8
+    LLM_HTTP_MAX_CONNECTIONS: int = 100  # LLM API向け共有HTTPクライアントの最大接続数
+    LLM_HTTP_MAX_KEEPALIVE: int = 50  # 再利用のために保持するアイドル接続数
+    LLM_HTTP_TIMEOUT: float = 60.0  # LLM API呼び出しのタイムアウト（秒）
     
     # OpenAI
     OPENAI_API_KEY: str = ""  # 実際のキーが必要な場合のみ設定
     OPENAI_MODEL: str = "gpt-3.5-turbo"
+    OPENAI_FAST_MODEL: str = "gpt-4o-mini"  # スコア評価・トピック抽出など短い出力の分類用
     
     # Anthropic  
     ANTHROPIC_API_KEY: str = ""  # 実際のキーが必要な場合のみ設定
@@ -0,0 +1,34 @@
+"""
+LLMプロバイダー向けの共有HTTPクライアント
+プロセス内の全ChatOpenAIインスタンスで接続プールを共有する
+"""
+
+from typing import Optional
+import httpx
+
+from app.core.config import settings
+
+_shared_async_client: Optional[httpx.AsyncClient] = None
+
+
+def get_shared_async_client() -> httpx.AsyncClient:
+    """プロセス共通のhttpx.AsyncClientを取得（初回呼び出し時に作成）"""
+    global _shared_async_client
+    if _shared_async_client is None or _shared_async_client.is_closed:
+        _shared_async_client = httpx.AsyncClient(
+            http2=True,
+            timeout=settings.LLM_HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_HTTP_MAX_KEEPALIVE
+            )
+        )
+    return _shared_async_client
+
+
+async def close_shared_async_client() -> None:
+    """共有クライアントを閉じる（アプリケーション終了時に呼び出す）"""
+    global _shared_async_client
+    if _shared_async_client is not None:
+        await _shared_async_client.aclose()
+        _shared_async_client = None
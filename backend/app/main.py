@@ -1,24 +1,42 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from pydantic import BaseModel
 from typing import Dict, Any, List
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
 import logging
 
 from app.core.config import settings
+from app.core.openai_client import close_shared_async_client
 from app.api.test_endpoints import router as test_router
 from app.api.llm_demo_endpoints import router as demo_router
 from app.api.slack_endpoints import router as slack_router
+from app.services.slack_service import close_slack_service
 
 # ロギング設定
 logging.basicConfig(level=getattr(logging, settings.LOG_LEVEL))
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """アプリケーションの起動・終了処理"""
+    yield
+    # 処理中のSlackメッセージのワーカーを停止
+    await close_slack_service()
+    # 共有HTTPクライアントの接続プールを解放
+    await close_shared_async_client()
+
+
 # FastAPIアプリケーション
 app = FastAPI(
     title=settings.APP_NAME,
     version=settings.APP_VERSION,
-    debug=settings.DEBUG
+    debug=settings.DEBUG,
+    lifespan=lifespan,
+    # レスポンスのJSON化はorjsonで行う（日本語をエスケープせずUTF-8のまま出力）
+    default_response_class=ORJSONResponse
 )
 
 # CORS設定
@@ -59,11 +77,10 @@ class ConversationTestResponse(BaseModel):
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
     """ヘルスチェック"""
-    from datetime import datetime
     return HealthResponse(
         status="healthy",
         version=settings.APP_VERSION,
-        timestamp=datetime.utcnow().isoformat()
+        timestamp=datetime.now(timezone.utc).isoformat(timespec="seconds")
     )
 
 
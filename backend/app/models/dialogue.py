@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Optional, List
 from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON
 from sqlalchemy.ext.declarative import declarative_base
@@ -7,14 +7,22 @@ from sqlalchemy.orm import relationship
 Base = declarative_base()
 
 
+def utc_now() -> datetime:
+    """現在時刻（UTC）をタイムゾーンなしで返す（DateTime カラムの既存データと同じ形式）
+    
+    非推奨の datetime.utcnow() の代替。
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 class DialogueSession(Base):
     __tablename__ = "dialogue_sessions"
     
     id = Column(String, primary_key=True)
     user_id = Column(String, nullable=False)
     status = Column(String, default="active")  # active, completed, archived
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, default=utc_now)
+    updated_at = Column(DateTime, default=utc_now, onupdate=utc_now)
     
     # Relationships
     messages = relationship("DialogueMessage", back_populates="session")
@@ -28,7 +36,7 @@ class DialogueMessage(Base):
     session_id = Column(String, ForeignKey("dialogue_sessions.id"), nullable=False)
     role = Column(String, nullable=False)  # user, assistant, system
     content = Column(Text, nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=utc_now)
     
     # Relationships
     session = relationship("DialogueSession", back_populates="messages")
@@ -1,29 +1,137 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+from collections import deque
+import asyncio
 from langchain.memory import ConversationSummaryBufferMemory
-from langchain.schema import BaseMessage, HumanMessage, AIMessage
+from langchain.schema import (
+    BaseMessage, HumanMessage, AIMessage, message_to_dict, messages_from_dict
+)
 from langchain_community.chat_message_histories import RedisChatMessageHistory
 from langchain.memory.chat_memory import BaseChatMemory
 from langchain_openai import ChatOpenAI
-import json
-from datetime import datetime
+import inspect
+import logging
+import re
+import orjson
 import redis.asyncio as redis
+from redis import Redis as SyncRedis
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
 from app.core.config import settings
-from app.models.dialogue import DialogueSession, DialogueMessage, DialogueContext
+from app.core.openai_client import get_shared_async_client
+from app.models.dialogue import DialogueSession, DialogueMessage, DialogueContext, utc_now
+from app.services.llm_batch_queue import LLMBatchQueue
+from app.services.session_store import TTLSessionStore
+
+logger = logging.getLogger(__name__)
+
+
+class SimpleMessage:
+    """DBに保存しない場合に add_message が返す簡易メッセージ"""
+    
+    def __init__(self, session_id: str, role: str, content: str):
+        self.session_id = session_id
+        self.role = role
+        self.content = content
+        self.timestamp = utc_now()
+
+
+class SharedRedisChatMessageHistory(RedisChatMessageHistory):
+    """共有の同期Redisクライアントを使う会話履歴
+    
+    RedisChatMessageHistory は生成のたびに独自のクライアントと接続プールを作る
+    （クラスタ判定のため生成時に接続も開く）ため、セッション数だけ接続が残ってしまう。
+    履歴の読み書きは親クラスの実装をそのまま使い、クライアントのみ外部から受け取る。
+    """
+    
+    def __init__(
+        self,
+        session_id: str,
+        redis_client: SyncRedis,
+        key_prefix: str = "message_store:",
+        ttl: Optional[int] = None
+    ):
+        self.redis_client = redis_client
+        self.session_id = session_id
+        self.key_prefix = key_prefix
+        self.ttl = ttl
+
+
+# 主要トピック抽出のプロンプト（インポート時に1度だけ整形し、呼び出し時は会話部分のみ埋め込む）
+_KEY_TOPICS_PROMPT = inspect.cleandoc("""
+    以下の会話から主要なトピックを3-5個抽出してください。
+    JSONフォーマットで返してください。
+    
+    会話:
+    {conversation_text}
+    
+    フォーマット例:
+    ["トピック1", "トピック2", "トピック3"]
+    """)
+
+# よく出る相談トピックのラベルと判定キーワード（該当が十分あればLLMを呼ばずに抽出する）
+_KEY_TOPIC_LABELS = {
+    "プレゼン緊張": ["緊張", "頭が真っ白", "あがり"],
+    "プレゼンテーション": ["プレゼン", "発表", "資料"],
+    "新規開拓": ["新規開拓", "新規顧客", "テレアポ", "飛び込み"],
+    "顧客関係構築": ["既存顧客", "関係構築", "信頼関係", "フォロー"],
+    "商談・クロージング": ["商談", "クロージング", "成約", "受注", "値引き"],
+    "ヒアリング": ["ヒアリング", "ニーズ", "聞き出"],
+    "提案力": ["提案"],
+    "目標・成果": ["目標", "売上", "ノルマ", "予算", "成果"],
+    "時間管理": ["時間", "忙し", "優先順位", "期限"],
+    "コミュニケーション": ["コミュニケーション", "会話", "伝え方", "説明"],
+    "チーム・上司": ["チーム", "上司", "部下", "同僚"],
+    "スキルアップ": ["スキル", "学習", "勉強", "研修", "成長"],
+}
+_KEYWORD_TO_KEY_TOPIC = {
+    keyword: label for label, keywords in _KEY_TOPIC_LABELS.items() for keyword in keywords
+}
+_KEY_TOPIC_PATTERN = re.compile(
+    "|".join(map(re.escape, sorted(_KEYWORD_TO_KEY_TOPIC, key=len, reverse=True)))
+)
 
 
 class ConversationMemoryService:
     """LangChainを使用した会話履歴管理サービス"""
     
+    # 要約を含める場合にそのまま渡す直近メッセージ数
+    RECENT_MESSAGE_WINDOW = 6
+    # 古いメッセージの要約を更新する間隔（未要約メッセージ数）
+    SUMMARY_REFRESH_INTERVAL = 4
+    # get_recent で保持する直近メッセージ数
+    RECENT_CACHE_SIZE = 5
+    # Redis上の会話履歴の保持期間
+    HISTORY_TTL_SECONDS = 86400  # 24時間
+    # ローカル判定でこの数以上のトピックが得られればLLMでの抽出を省略
+    MIN_LOCAL_KEY_TOPICS = 3
+    
     def __init__(self):
         self.redis_client = None
+        # セッションごとの (要約済みメッセージ数, 要約) を保持
+        self._rolling_summaries = TTLSessionStore()
+        # セッションごとの直近メッセージ（Redisから全履歴を読まずに参照するため）
+        self._recent: TTLSessionStore = TTLSessionStore()
+        # セッションごとのメモリインスタンス（Redisクライアントの生成・接続をターンごとに行わない）
+        self._memories = TTLSessionStore()
+        # 会話履歴の同期クライアント（全セッションで1つの接続プールを共有する。接続は初回使用時）
+        self._sync_redis_client = SyncRedis.from_url(settings.REDIS_URL)
         self.llm = ChatOpenAI(
             model=settings.OPENAI_MODEL,
             temperature=0.3,
-            api_key=settings.OPENAI_API_KEY
+            api_key=settings.OPENAI_API_KEY,
+            http_async_client=get_shared_async_client()
+        )
+        # トピック抽出は短いリストを返すだけのため軽量モデルを使う
+        self.fast_llm = ChatOpenAI(
+            model=settings.OPENAI_FAST_MODEL,
+            temperature=0,
+            max_tokens=64,
+            api_key=settings.OPENAI_API_KEY,
+            http_async_client=get_shared_async_client()
         )
+        # 複数セッションで同時に発生したトピック抽出をまとめて送信するキュー
+        self._fast_llm_queue = LLMBatchQueue(self.fast_llm)
     
     async def initialize(self):
         """Redis接続の初期化"""
@@ -38,13 +146,21 @@ class ConversationMemoryService:
         session_id: str,
         max_token_limit: int = 2000
     ) -> ConversationSummaryBufferMemory:
-        """セッション用のメモリインスタンスを取得または作成"""
-        # Redis履歴ストレージ
-        message_history = RedisChatMessageHistory(
+        """セッション用のメモリインスタンスを取得または作成
+        
+        履歴はRedis側に保持されるため、インスタンスはセッション単位で再利用する。
+        """
+        memory_key = (session_id, max_token_limit)
+        memory = self._memories.get(memory_key)
+        if memory is not None:
+            return memory
+        
+        # Redis履歴ストレージ（セッションごとに接続プールを作らない）
+        message_history = SharedRedisChatMessageHistory(
             session_id=f"session:{session_id}",
-            url=settings.REDIS_URL,
+            redis_client=self._sync_redis_client,
             key_prefix="dialogue:",
-            ttl=86400  # 24時間
+            ttl=self.HISTORY_TTL_SECONDS
         )
         
         # 要約付きバッファメモリ
@@ -55,6 +171,7 @@ class ConversationMemoryService:
             return_messages=True,
             memory_key="chat_history"
         )
+        self._memories[memory_key] = memory
         
         return memory
     
@@ -69,50 +186,117 @@ class ConversationMemoryService:
         # LangChainメモリに追加
         memory = await self.get_or_create_memory(session_id)
         
+        message: Optional[BaseMessage] = None
         if role == "user":
-            memory.chat_memory.add_user_message(content)
+            message = HumanMessage(content=content)
         elif role == "assistant":
-            memory.chat_memory.add_ai_message(content)
+            message = AIMessage(content=content)
+        
+        # Redis履歴への書き込みとDB保存は互いに独立しているため並行して実行する
+        pending = []
+        if message is not None:
+            # 直近メッセージのキャッシュも更新（未読み込みのセッションは初回参照時に構築）
+            recent = self._recent.get(session_id)
+            if recent is not None:
+                recent.append(message)
+            if self.redis_client:
+                pending.append(self._push_history(memory.chat_memory.key, message))
+            else:
+                # RedisChatMessageHistory は同期クライアントのため、
+                # イベントループを塞がないようスレッドで実行
+                pending.append(asyncio.to_thread(memory.chat_memory.add_message, message))
         
         # DB操作はオプショナル（dbがNoneの場合はスキップ）
         if db is not None:
-            try:
-                session = await db.get(DialogueSession, session_id)
-                if not session:
-                    # セッションを作成
-                    new_session = DialogueSession(
-                        id=session_id,
-                        user_id=session_id.replace("slack_", ""),
-                        status="active"
-                    )
-                    db.add(new_session)
-                    await db.commit()
-                
-                # メッセージを保存
-                db_message = DialogueMessage(
-                    session_id=session_id,
-                    role=role,
-                    content=content
-                )
-                db.add(db_message)
-                await db.commit()
-                await db.refresh(db_message)
-                return db_message
-            except Exception:
-                # DB操作に失敗した場合は無視
-                pass
+            pending.append(self._save_message_to_db(session_id, role, content, db))
         
-        # 簡単なメッセージオブジェクトを返す
-        class SimpleMessage:
-            def __init__(self, session_id, role, content):
-                self.session_id = session_id
-                self.role = role
-                self.content = content
-                from datetime import datetime
-                self.timestamp = datetime.utcnow()
+        results = await asyncio.gather(*pending)
+        if db is not None and results[-1] is not None:
+            return results[-1]
         
+        # 簡単なメッセージオブジェクトを返す
         return SimpleMessage(session_id, role, content)
     
+    async def _push_history(self, key: str, message: BaseMessage) -> None:
+        """履歴への追加とTTL更新を1回のパイプラインで送信
+        
+        RedisChatMessageHistory.add_message と同じ形式（LPUSH + EXPIRE）で書き込むため、
+        読み出しは従来どおり chat_memory.messages で行える。
+        """
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.lpush(key, orjson.dumps(message_to_dict(message)))
+            pipe.expire(key, self.HISTORY_TTL_SECONDS)
+            await pipe.execute()
+    
+    async def get_recent(self, session_id: str) -> Iterable[BaseMessage]:
+        """直近 RECENT_CACHE_SIZE 件のメッセージを取得
+        
+        初回のみRedisの履歴から構築し、以降は add_message で更新される deque を返す。
+        """
+        recent = self._recent.get(session_id)
+        if recent is None:
+            memory = await self.get_or_create_memory(session_id)
+            recent = deque(
+                await self._load_messages(memory, limit=self.RECENT_CACHE_SIZE),
+                maxlen=self.RECENT_CACHE_SIZE
+            )
+            self._recent[session_id] = recent
+        return recent
+    
+    async def get_messages(self, session_id: str) -> List[BaseMessage]:
+        """セッションの全メッセージを時系列順に取得"""
+        memory = await self.get_or_create_memory(session_id)
+        return await self._load_messages(memory)
+    
+    async def _load_messages(
+        self,
+        memory: ConversationSummaryBufferMemory,
+        limit: Optional[int] = None
+    ) -> List[BaseMessage]:
+        """Redisの履歴を時系列順に読み込む（limit 指定時は直近 limit 件のみ）"""
+        if self.redis_client:
+            # 履歴はLPUSHで新しい順に並んでいるため、先頭から必要な件数だけを
+            # 非同期クライアントで取得し時系列順に戻す
+            end = -1 if limit is None else limit - 1
+            items = await self.redis_client.lrange(memory.chat_memory.key, 0, end)
+            return messages_from_dict([orjson.loads(item) for item in reversed(items)])
+        # 同期クライアントでの読み込みはイベントループを塞がないようスレッドで実行
+        messages = await asyncio.to_thread(lambda: memory.chat_memory.messages)
+        return messages if limit is None else messages[-limit:]
+    
+    async def _save_message_to_db(
+        self,
+        session_id: str,
+        role: str,
+        content: str,
+        db: AsyncSession
+    ) -> Optional[DialogueMessage]:
+        """メッセージをDBに保存（失敗した場合は None）"""
+        try:
+            session = await db.get(DialogueSession, session_id)
+            if not session:
+                # セッションを作成（メッセージと同じコミットで保存）
+                new_session = DialogueSession(
+                    id=session_id,
+                    user_id=session_id.replace("slack_", ""),
+                    status="active"
+                )
+                db.add(new_session)
+            
+            # メッセージを保存（セッション作成とまとめて1回のコミットで確定）
+            db_message = DialogueMessage(
+                session_id=session_id,
+                role=role,
+                content=content
+            )
+            db.add(db_message)
+            await db.commit()
+            await db.refresh(db_message)
+            return db_message
+        except Exception:
+            # DB操作に失敗した場合は無視
+            return None
+    
     async def get_conversation_context(
         self,
         session_id: str,
@@ -121,41 +305,58 @@ class ConversationMemoryService:
         """現在の会話コンテキストを取得"""
         memory = await self.get_or_create_memory(session_id)
         
-        # メッセージ履歴
-        messages = memory.chat_memory.messages
+        # メッセージ履歴（同期クライアントでイベントループを塞がないよう非同期に取得）
+        messages = await self._load_messages(memory)
+        
+        # 要約を含める場合は古いメッセージを要約に置き換え、要約に含まれない分をそのまま渡す
+        # （プロンプトサイズを会話長に依存しない一定量に抑える）
+        summary = None
+        recent_messages = messages
+        if include_summary and len(messages) > 10:
+            older_messages = messages[:-self.RECENT_MESSAGE_WINDOW]
+            covered, summary = await self._generate_summary(session_id, memory, older_messages)
+            # 要約を再生成しなかったターンでも、要約済み以降を全て渡して抜けをなくす
+            recent_messages = messages[covered:]
         
         # コンテキスト構築
         context = {
             "session_id": session_id,
             "message_count": len(messages),
+            # 要約に置き換えた分も含むユーザー発言数（履歴が交互に並ぶとは限らないため実数で数える）
+            "user_message_count": sum(1 for msg in messages if isinstance(msg, HumanMessage)),
             "messages": [
                 {
                     "role": "user" if isinstance(msg, HumanMessage) else "assistant",
                     "content": msg.content
                 }
-                for msg in messages
+                for msg in recent_messages
             ]
         }
         
-        # 要約を含める場合
-        if include_summary and len(messages) > 10:
-            context["summary"] = await self._generate_summary(memory)
+        if summary is not None:
+            context["summary"] = summary
         
         return context
     
-    async def _generate_summary(self, memory: ConversationSummaryBufferMemory) -> str:
-        """会話の要約を生成"""
-        # LangChainの要約機能を使用
-        summary = memory.moving_summary_buffer
-        if not summary:
-            # 要約がない場合は生成
-            messages = memory.chat_memory.messages
-            if messages:
-                summary = await memory.predict_new_summary(
-                    messages=messages,
-                    existing_summary=""
-                )
-        return summary
+    async def _generate_summary(
+        self,
+        session_id: str,
+        memory: ConversationSummaryBufferMemory,
+        older_messages: List[BaseMessage]
+    ) -> Tuple[int, str]:
+        """古いメッセージのローリング要約を (要約済みメッセージ数, 要約) で取得
+        
+        前回の要約以降に SUMMARY_REFRESH_INTERVAL 件以上のメッセージが溜まった場合のみ、
+        未要約分だけを既存の要約に追記する形で再生成する。
+        """
+        covered, summary = self._rolling_summaries.get(session_id, (0, ""))
+        pending = older_messages[covered:]
+        if pending and (not summary or len(pending) >= self.SUMMARY_REFRESH_INTERVAL):
+            # 同期APIのためイベントループを塞がないようスレッドで実行
+            summary = await asyncio.to_thread(memory.predict_new_summary, pending, summary)
+            covered = len(older_messages)
+            self._rolling_summaries[session_id] = (covered, summary)
+        return covered, summary
     
     async def save_context_snapshot(
         self,
@@ -193,39 +394,57 @@ class ConversationMemoryService:
         
         # 最近のメッセージから抽出
         recent_messages = messages[-10:]  # 最新10件
+        
+        # 既知のトピックラベルで十分に拾えればLLMを呼ばない
+        local_topics = self._match_key_topics(recent_messages)
+        if len(local_topics) >= self.MIN_LOCAL_KEY_TOPICS:
+            logger.debug(f"Key topics matched locally: {local_topics}")
+            return local_topics[:5]
+        logger.debug(f"Key topic bank matched {len(local_topics)} label(s), falling back to LLM")
+        
         conversation_text = "\n".join([
             f"{msg['role']}: {msg['content']}" 
             for msg in recent_messages
         ])
         
-        prompt = f"""
-        以下の会話から主要なトピックを3-5個抽出してください。
-        JSONフォーマットで返してください。
-        
-        会話:
-        {conversation_text}
-        
-        フォーマット例:
-        ["トピック1", "トピック2", "トピック3"]
-        """
-        
-        response = await self.llm.ainvoke(prompt)
+        response = await self._fast_llm_queue.submit(
+            _KEY_TOPICS_PROMPT.format(conversation_text=conversation_text)
+        )
+        # LLMの応答が使えない場合は、ローカルで拾えた分だけでも返す
         try:
-            topics = json.loads(response.content)
-            return topics[:5]  # 最大5個
-        except:
-            return []
+            topics = orjson.loads(response.content)
+        except orjson.JSONDecodeError:
+            return local_topics
+        if not isinstance(topics, list):
+            return local_topics
+        return topics[:5]  # 最大5個
+    
+    @staticmethod
+    def _match_key_topics(messages: List[Dict[str, str]]) -> List[str]:
+        """ユーザー発言からトピックラベルを出現順に抽出（重複なし）"""
+        text = "\n".join(msg["content"] for msg in messages if msg["role"] == "user")
+        matched = dict.fromkeys(
+            _KEYWORD_TO_KEY_TOPIC[match.group()] for match in _KEY_TOPIC_PATTERN.finditer(text)
+        )
+        return list(matched)
     
     async def clear_session(self, session_id: str):
         """セッションの会話履歴をクリア"""
         memory = await self.get_or_create_memory(session_id)
         memory.clear()
         
-        # Redisからも削除
+        # プロセス内のキャッシュも破棄（クリア後に古い履歴・要約が返らないようにする）
+        self._recent.pop(session_id, None)
+        self._rolling_summaries.pop(session_id, None)
+        for memory_key in [key for key in self._memories if key[0] == session_id]:
+            self._memories.pop(memory_key, None)
+        
+        # Redisからも削除（キーを集めてから1回のUNLINKでまとめて削除）
         if self.redis_client:
             pattern = f"dialogue:session:{session_id}:*"
-            async for key in self.redis_client.scan_iter(match=pattern):
-                await self.redis_client.delete(key)
+            keys = [key async for key in self.redis_client.scan_iter(match=pattern, count=500)]
+            if keys:
+                await self.redis_client.unlink(*keys)
     
     async def get_similar_conversations(
         self,
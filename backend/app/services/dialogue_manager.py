@@ -1,14 +1,103 @@
 from typing import Dict, Any, List, Optional, Tuple
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.schema.runnable import RunnablePassthrough
 from langchain_openai import ChatOpenAI
 from langchain.output_parsers import PydanticOutputParser
 from pydantic import BaseModel, Field
-from datetime import datetime
-import json
+from datetime import datetime, timezone
+import asyncio
+import contextlib
+import re
+import orjson
 
 from app.services.conversation_memory import ConversationMemoryService
+from app.services.llm_batch_queue import LLMBatchQueue
+from app.services.llm_cache import LLMResponseCache, normalize_for_cache
+from app.services.llm_output import dedupe_questions, parse_score
+from app.services.session_store import TTLSessionStore
 from app.core.config import settings
+from app.core.openai_client import get_shared_async_client
+
+
+# LLM応答から「Q: 」「質問1: 」形式の行を取り出すパターン
+_QUESTION_LINE = re.compile(r"^[ \t]*(?:Q|質問[^:：\n]*)[:：][ \t]*(.+?)[ \t]*$", re.MULTILINE)
+# 「Q: 」形式に従わず番号・箇条書きで返された場合の質問行（行頭の記号・番号を除いて取り出す）
+_LISTED_QUESTION_LINE = re.compile(
+    r"^[ \t]*(?:\d+[.)．）]|[・\-*])[ \t]*(.+?[?？])[ \t]*$", re.MULTILINE
+)
+
+
+# 固定のシステムメッセージ（呼び出しごとに再生成せず、同一オブジェクトを再利用する）
+# 本文はインデントを含めない文字列とし、送信トークンを減らす
+_COMPLETENESS_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": (
+        "営業スキル向上のアクションプラン作成に必要な情報の充足度を評価してください。\n"
+        "\n"
+        "以下の観点で評価してください：\n"
+        "1. 現在の課題や悩みが明確か\n"
+        "2. 具体的な状況や事例があるか\n"
+        "3. 目標や期待される成果が明確か\n"
+        "4. 現在のスキルレベルが把握できるか\n"
+        "5. 利用可能なリソースや制約が明確か\n"
+        "\n"
+        "0-100のスコアで評価してください。数字のみ回答してください。"
+    )
+}
+
+_FOLLOW_UP_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": (
+        "これまでの会話内容を踏まえて、"
+        "アクションプラン作成に必要な追加情報を収集するための質問を生成してください。\n"
+        "\n"
+        "以下の点に注意してください：\n"
+        "1. すでに得られた情報を踏まえて、より具体的な質問をする\n"
+        "2. 実践的で測定可能なアクションにつながる情報を収集する\n"
+        "3. 営業スキル向上に直接関連する質問をする\n"
+        "\n"
+        "質問は1行ずつ「Q: 」で始めて3-5個回答してください。"
+    )
+}
+
+# ルールベースの充足度評価で加点するキーワード（評価観点：課題・状況・目標・スキル・制約）
+_COMPLETENESS_KEYWORD_LIST = (
+    "課題", "悩み", "状況", "事例", "具体的", "目標",
+    "成果", "スキル", "経験", "期限", "制約", "リソース"
+)
+_COMPLETENESS_KEYWORDS = re.compile("|".join(_COMPLETENESS_KEYWORD_LIST))
+
+# 新しい情報を含まない短い相づち・否定の回答（末尾の句読点を除いて比較）
+_TRIVIAL_RESPONSES = frozenset((
+    "はい", "いいえ", "うん", "ええ", "そうです", "わかりました", "わかりません",
+    "特にない", "特にないです", "特になし", "ありません", "ないです", "大丈夫です"
+))
+_TRAILING_PUNCTUATION = "。．.！!？?、, 　"
+
+# ユーザーメッセージのテンプレート（可変部分のみを埋め込む）
+_COMPLETENESS_USER_TEMPLATE = "会話履歴：\n{context}\n\n充足度スコア（0-100）:"
+_FOLLOW_UP_USER_TEMPLATE = (
+    "会話履歴：\n{chat_history}\n\n"
+    "追加で必要な情報を収集するための質問を生成してください。"
+)
+
+
+def _dumps(obj: Any) -> str:
+    """JSON文字列に変換（orjsonはUTF-8をそのまま出力するためensure_ascii不要）"""
+    return orjson.dumps(obj).decode()
+
+
+def _format_initial_context(initial_context: Dict[str, Any]) -> str:
+    """初期コンテキストを「キー: 値」の行に整形
+    
+    JSONの括弧や引用符の分だけプロンプトのトークンが増えないよう、
+    値が入れ子（dict / list）の場合のみJSONにする。
+    """
+    lines = []
+    for key, value in initial_context.items():
+        if isinstance(value, (dict, list, tuple)):
+            value = _dumps(value)
+        lines.append(f"{key}: {value}")
+    return "\n".join(lines)
 
 
 class QuestionResponse(BaseModel):
@@ -30,19 +119,95 @@ class ActionPlanResponse(BaseModel):
 class DialogueManager:
     """対話フローを管理するマネージャー"""
     
+    # ユーザー発言の合計文字数がこれ未満なら、充足度はLLMに問い合わせるまでもなく不足と判定
+    MIN_USER_CHARS_FOR_LLM_SCORING = 60
+    # 上記で判定した場合の推定スコアの上限（アクションプラン生成の閾値80には届かせない）
+    MAX_PREFILTER_SCORE = 45
+    # ルールベースのスコアがこの範囲（閾値80の前後）に入った場合のみLLMで評価する
+    LLM_SCORING_BAND = (60, 90)
+    # これより短い回答は新しい情報を含まないとみなし、充足度のLLM評価を行わない
+    MIN_INFORMATIVE_CHARS = 5
+    
     def __init__(self):
         self.memory_service = ConversationMemoryService()
         self.llm = ChatOpenAI(
             model=settings.OPENAI_MODEL,
             temperature=0.7,
-            api_key=settings.OPENAI_API_KEY
+            api_key=settings.OPENAI_API_KEY,
+            http_async_client=get_shared_async_client()
+        )
+        # 充足度スコアのような短い分類出力には軽量モデルを使う
+        self.fast_llm = ChatOpenAI(
+            model=settings.OPENAI_FAST_MODEL,
+            temperature=0,
+            max_tokens=4,
+            api_key=settings.OPENAI_API_KEY,
+            http_async_client=get_shared_async_client()
         )
         self.question_parser = PydanticOutputParser(pydantic_object=QuestionResponse)
         self.action_plan_parser = PydanticOutputParser(pydantic_object=ActionPlanResponse)
+        # フォーマット指示はパーサーごとに不変のため、スキーマの文字列化は1度だけ行う
+        self._question_format = self.question_parser.get_format_instructions()
+        # 初期質問生成のプロンプトも固定部分は不変のため、フォーマット指示を埋め込んで1度だけ構築
+        self._start_prompt = ChatPromptTemplate.from_messages([
+            ("system", """あなたは新人営業マンの成長を支援するAIアシスタントです。
+            1on1セッションの内容から、営業スキル向上のための具体的なアクションプランを作成するために
+            必要な情報を収集します。
+            
+            ユーザーから提供される情報を基に、
+            効果的なアクションプランを作成するために追加で必要な情報を特定し、
+            3-5個の具体的で答えやすい質問を生成してください。
+            
+            {format_instructions}
+            """),
+            # 可変の初期コンテキストはユーザーメッセージ側に置き、
+            # システムプロンプトを呼び出し間で同一に保つ
+            ("user", """提供されている情報：
+            {initial_context}
+            
+            1on1セッションの内容を分析し、
+            追加で必要な情報を収集するための質問を生成してください。""")
+        ]).partial(format_instructions=self._question_format)
+        self._start_chain = self._start_prompt | self.llm | self.question_parser
+        # アクションプラン生成のプロンプトは固定のため、フォーマット指示を埋め込んで1度だけ構築
+        self._action_plan_prompt = ChatPromptTemplate.from_messages([
+            ("system", """会話内容を基に、新人営業マンの成長のための
+            具体的で実行可能なアクションプランを作成してください。
+            
+            以下の要素を含めてください：
+            1. 具体的なアクションアイテム（優先順位付き）
+            2. 各アクションの期限と成功指標
+            3. 必要なリソースやサポート
+            4. 期待される成果
+            
+            {format_instructions}
+            """),
+            MessagesPlaceholder(variable_name="chat_history"),
+            ("user", "これまでの会話内容を基に、成長支援のためのアクションプランを作成してください。")
+        ]).partial(format_instructions=self.action_plan_parser.get_format_instructions())
+        # 入力は chat_history をそのまま渡すため、チェーンも呼び出しごとに組み立てない
+        self._action_plan_chain = self._action_plan_prompt | self.llm | self.action_plan_parser
+        # 同時に到着したLLM呼び出しをまとめて送信するキュー
+        self._llm_queue = LLMBatchQueue(self.llm)
+        self._fast_llm_queue = LLMBatchQueue(self.fast_llm)
+        # 同一プロンプトへのLLM応答キャッシュ（Redis接続は initialize 時に設定）
+        self._llm_cache = LLMResponseCache()
+        # 充足度スコアのキャッシュ
+        # （セッションIDを含まない会話内容の正規化形をキーにセッション間で共有）
+        self._score_cache = LLMResponseCache(prefix="llm:score:")
+        # 初期質問のキャッシュ（表記ゆれを除いて同じ初期コンテキストであれば生成結果を再利用）
+        self._start_cache = LLMResponseCache(prefix="llm:start:")
+        # 対話状態のプロセス内キャッシュ（Redisへのライトスルー、TTLはRedisと同じ24時間）
+        self._dialogue_states = TTLSessionStore(ttl=86400)
+        # セッションごとの直近の充足度スコア（相づちの回答で充足度を上げないために参照）
+        self._last_scores = TTLSessionStore(ttl=86400)
     
     async def initialize(self):
         """サービスの初期化"""
         await self.memory_service.initialize()
+        self._llm_cache.redis_client = self.memory_service.redis_client
+        self._score_cache.redis_client = self.memory_service.redis_client
+        self._start_cache.redis_client = self.memory_service.redis_client
     
     async def start_dialogue(
         self,
@@ -50,46 +215,32 @@ class DialogueManager:
         initial_context: Dict[str, Any]
     ) -> Tuple[List[str], Dict[str, Any]]:
         """対話セッションを開始"""
-        # 初期質問生成のプロンプト
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", """あなたは新人営業マンの成長を支援するAIアシスタントです。
-            1on1セッションの内容から、営業スキル向上のための具体的なアクションプランを作成するために
-            必要な情報を収集します。
-            
-            以下の情報が提供されています：
-            {initial_context}
-            
-            効果的なアクションプランを作成するために追加で必要な情報を特定し、
-            3-5個の具体的で答えやすい質問を生成してください。
-            
-            {format_instructions}
-            """),
-            ("user", "1on1セッションの内容を分析し、追加で必要な情報を収集するための質問を生成してください。")
-        ])
-        
-        # チェーン構築
-        chain = (
-            {
-                "initial_context": RunnablePassthrough(),
-                "format_instructions": lambda _: self.question_parser.get_format_instructions()
-            }
-            | prompt
-            | self.llm
-            | self.question_parser
+        # キー順や空白・全角半角の違いを除いて同じ初期コンテキストならキャッシュから返す
+        cache_key = self._start_cache.make_key(
+            sorted(normalize_for_cache(initial_context).items())
         )
+        cached = await self._start_cache.get(cache_key)
+        if cached is not None:
+            response = QuestionResponse.model_validate_json(cached)
+            return response.questions, self._start_metadata(response)
         
-        # 質問生成
-        response = await chain.ainvoke(json.dumps(initial_context, ensure_ascii=False))
+        # 質問生成（チェーンは __init__ で構築済み、入力はプロンプト変数として渡す）
+        response = await self._start_chain.ainvoke({
+            "initial_context": _format_initial_context(initial_context)
+        })
+        await self._start_cache.set(cache_key, response.model_dump_json())
         
-        # メタデータ作成
-        metadata = {
+        return response.questions, self._start_metadata(response)
+    
+    @staticmethod
+    def _start_metadata(response: QuestionResponse) -> Dict[str, Any]:
+        """初期質問のメタデータ作成"""
+        return {
             "stage": "initial",
             "reasoning": response.reasoning,
             "information_needed": response.information_needed,
             "completeness_score": response.completeness_score
         }
-        
-        return response.questions, metadata
     
     async def process_user_response(
         self,
@@ -112,86 +263,159 @@ class DialogueManager:
             include_summary=True
         )
         
-        # 情報の充足度を評価
-        completeness_score = await self._evaluate_completeness(context)
+        # 相づちのような回答では充足度は変わらないため、ルールベースのスコアのみで判定
+        use_llm_scoring = not self._is_trivial_response(user_response)
+        
+        # 情報の充足度評価と並行して、フォローアップ質問を投機的に生成
+        # （多くのターンは質問継続になるため、評価のLLM待ちと重ねて実行する）
+        follow_up_task = asyncio.create_task(self._generate_follow_up_questions(context))
+        try:
+            completeness_score = await self._evaluate_completeness(context, use_llm_scoring)
+        except Exception:
+            await self._discard_task(follow_up_task)
+            raise
+        self._last_scores[session_id] = completeness_score
         
         if completeness_score >= 80:
-            # 十分な情報が集まった場合、アクションプラン生成
+            # 十分な情報が集まった場合、投機的な質問生成は破棄してアクションプラン生成
+            await self._discard_task(follow_up_task)
             action_plan = await self._generate_action_plan(context)
-            return {
+            result = {
                 "type": "action_plan",
                 "data": action_plan,
                 "completeness_score": completeness_score
             }
         else:
-            # まだ情報が不足している場合、追加質問生成
-            follow_up_questions = await self._generate_follow_up_questions(context)
-            return {
+            # まだ情報が不足している場合、生成済みの追加質問を使用
+            follow_up_questions = await follow_up_task
+            result = {
                 "type": "follow_up",
                 "questions": follow_up_questions,
                 "completeness_score": completeness_score
             }
+        
+        return result
+    
+    @staticmethod
+    async def _discard_task(task: asyncio.Task) -> None:
+        """投機的に起動したタスクを破棄（既に失敗していた場合も例外を回収してログに残さない）"""
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError, Exception):
+            await task
     
-    async def _evaluate_completeness(self, context: Dict[str, Any]) -> int:
-        """情報の充足度を評価"""
-        context_str = json.dumps(context, ensure_ascii=False, indent=2)
+    @classmethod
+    def _is_trivial_response(cls, user_response: str) -> bool:
+        """新しい情報を含まない短い回答か（「はい」「特にないです」など）"""
+        text = user_response.strip().rstrip(_TRAILING_PUNCTUATION)
+        return len(text) < cls.MIN_INFORMATIVE_CHARS or text in _TRIVIAL_RESPONSES
+    
+    async def _evaluate_completeness(self, context: Dict[str, Any], use_llm: bool = True) -> int:
+        """情報の充足度を評価
+        
+        会話回数とキーワードによるルールベースのスコアを基本とし、
+        アクションプラン生成の閾値付近（LLM_SCORING_BAND）の場合のみLLMで評価する。
+        use_llm が False の場合（相づちの回答）は充足度を上げないよう、ルールベースのスコアを
+        前回のスコア（なければ MAX_PREFILTER_SCORE）以下に抑えて返す。
+        """
+        # 会話回数・文字数の集計とキーワード走査を1パスで行う（全文の連結はしない）
+        user_turns = 0
+        user_chars = 0
+        matched_keywords = set()
+        for message in context["messages"]:
+            if message["role"] == "user":
+                user_turns += 1
+                user_chars += len(message["content"])
+                if len(matched_keywords) < len(_COMPLETENESS_KEYWORD_LIST):
+                    matched_keywords.update(_COMPLETENESS_KEYWORDS.findall(message["content"]))
+        
+        summary = context.get("summary")
+        if summary is None:
+            # 明らかに情報が足りないターンはLLMを呼ばずに会話回数ベースで推定
+            if user_chars < self.MIN_USER_CHARS_FOR_LLM_SCORING:
+                prefilter_score = min(user_turns * 15, self.MAX_PREFILTER_SCORE)
+                if not use_llm:
+                    return self._cap_trivial_score(context, prefilter_score)
+                return prefilter_score
+        else:
+            # 要約済みの古いメッセージも含めたユーザー発言の実数を会話回数とする
+            user_turns = context["user_message_count"]
+            if len(matched_keywords) < len(_COMPLETENESS_KEYWORD_LIST):
+                matched_keywords.update(_COMPLETENESS_KEYWORDS.findall(summary))
+        
+        # ルールベースのスコア（会話回数 x 15点・最大70点 + 評価観点キーワード1種につき5点）
+        rule_score = min(min(user_turns * 15, 70) + 5 * len(matched_keywords), 100)
+        if not use_llm:
+            return self._cap_trivial_score(context, rule_score)
+        band_low, band_high = self.LLM_SCORING_BAND
+        if not band_low <= rule_score < band_high:
+            return rule_score
+        
+        # 表記ゆれを除いて同じ会話内容であれば、他のセッションで得たスコアを再利用
+        score_key = self._score_cache.make_key(
+            normalize_for_cache([context["messages"], summary])
+        )
+        cached_score = await self._score_cache.get(score_key)
+        if cached_score is not None:
+            return int(cached_score)
+        
+        # 評価に必要な会話内容のみをインデントなしで直列化（セッションIDや件数は含めない）
+        payload: Dict[str, Any] = {"messages": context["messages"]}
+        if summary is not None:
+            payload["summary"] = summary
+        context_str = _dumps(payload)
         messages = [
-            {"role": "system", "content": """営業スキル向上のアクションプラン作成に必要な情報の充足度を評価してください。
-            
-            以下の観点で評価してください：
-            1. 現在の課題や悩みが明確か
-            2. 具体的な状況や事例があるか
-            3. 目標や期待される成果が明確か
-            4. 現在のスキルレベルが把握できるか
-            5. 利用可能なリソースや制約が明確か
-            
-            0-100のスコアで評価してください。数字のみ回答してください。"""},
-            {"role": "user", "content": f"会話履歴：\n{context_str}\n\n充足度スコア（0-100）:"}
+            _COMPLETENESS_SYSTEM_MESSAGE,
+            {"role": "user", "content": _COMPLETENESS_USER_TEMPLATE.format(context=context_str)}
         ]
         
-        response = await self.llm.ainvoke(messages)
-        try:
-            score = int(response.content.strip())
-            return min(max(score, 0), 100)  # 0-100の範囲に制限
-        except:
-            return 50  # デフォルト値
+        # スコアは上のキャッシュで保持するため、プロンプト単位の応答キャッシュは通さない
+        response = await self._fast_llm_queue.submit(messages)
+        score = parse_score(response.content)  # 0-100の範囲に制限済み
+        if score is None:
+            return rule_score  # 数値が得られない場合はルールベースのスコア
+        await self._score_cache.set(score_key, str(score))
+        return score
+    
+    def _cap_trivial_score(self, context: Dict[str, Any], score: int) -> int:
+        """相づちの回答で充足度が上がらないよう、前回のスコア以下に抑える
+        
+        新しい情報のない発言も会話回数に数えられるため、ルールベースのスコアだけでは上がってしまう。
+        """
+        last_score = self._last_scores.get(context["session_id"], self.MAX_PREFILTER_SCORE)
+        return min(score, last_score)
+    
+    async def _cached_llm_content(self, messages: List[Dict[str, str]]) -> str:
+        """同一プロンプトの応答はキャッシュから返し、未キャッシュ時のみLLMを呼び出す"""
+        cache_key = self._llm_cache.make_key(messages)
+        content = await self._llm_cache.get(cache_key)
+        if content is None:
+            response = await self._llm_queue.submit(messages)
+            content = response.content
+            await self._llm_cache.set(cache_key, content)
+        return content
     
     async def _generate_follow_up_questions(
         self,
         context: Dict[str, Any]
     ) -> List[str]:
         """フォローアップ質問を生成"""
-        # メモリから履歴を取得
-        memory = await self.memory_service.get_or_create_memory(context["session_id"])
-        messages = memory.chat_memory.messages
+        # 直近5メッセージを取得（全履歴の読み込み・スライスは行わない）
+        recent_messages = await self.memory_service.get_recent(context["session_id"])
         
         # 会話履歴を文字列に変換
-        chat_history = "\n".join([
-            f"{msg.type}: {msg.content}" for msg in messages[-5:]  # 最新5メッセージ
-        ])
+        chat_history = "\n".join(f"{msg.type}: {msg.content}" for msg in recent_messages)
         
         prompt_messages = [
-            {"role": "system", "content": """これまでの会話内容を踏まえて、アクションプラン作成に必要な追加情報を収集するための質問を生成してください。
-            
-            以下の点に注意してください：
-            1. すでに得られた情報を踏まえて、より具体的な質問をする
-            2. 実践的で測定可能なアクションにつながる情報を収集する
-            3. 営業スキル向上に直接関連する質問をする
-            
-            質問は1行ずつ「Q: 」で始めて3-5個回答してください。"""},
-            {"role": "user", "content": f"会話履歴：\n{chat_history}\n\n追加で必要な情報を収集するための質問を生成してください。"}
+            _FOLLOW_UP_SYSTEM_MESSAGE,
+            {"role": "user", "content": _FOLLOW_UP_USER_TEMPLATE.format(chat_history=chat_history)}
         ]
         
-        response = await self.llm.ainvoke(prompt_messages)
+        content = await self._cached_llm_content(prompt_messages)
         
-        # レスポンスから質問を抽出
-        questions = []
-        for line in response.content.split('\n'):
-            line = line.strip()
-            if line.startswith('Q:'):
-                questions.append(line[2:].strip())
-            elif line.startswith('質問'):
-                questions.append(line.split(':', 1)[-1].strip())
+        # レスポンスから質問を抽出（1回の正規表現走査）
+        questions = _QUESTION_LINE.findall(content) or _LISTED_QUESTION_LINE.findall(content)
+        # 表記ゆれだけが異なる重複質問を除く
+        questions = dedupe_questions(questions)
         
         # 最低1つの質問を保証
         if not questions:
@@ -204,36 +428,9 @@ class DialogueManager:
         context: Dict[str, Any]
     ) -> Dict[str, Any]:
         """アクションプランを生成"""
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", """会話内容を基に、新人営業マンの成長のための
-            具体的で実行可能なアクションプランを作成してください。
-            
-            以下の要素を含めてください：
-            1. 具体的なアクションアイテム（優先順位付き）
-            2. 各アクションの期限と成功指標
-            3. 必要なリソースやサポート
-            4. 期待される成果
-            
-            {format_instructions}
-            """),
-            MessagesPlaceholder(variable_name="chat_history"),
-            ("user", "これまでの会話内容を基に、成長支援のためのアクションプランを作成してください。")
-        ])
+        messages = await self.memory_service.get_messages(context["session_id"])
         
-        memory = await self.memory_service.get_or_create_memory(context["session_id"])
-        messages = memory.chat_memory.messages
-        
-        chain = (
-            {
-                "chat_history": lambda _: messages,
-                "format_instructions": lambda _: self.action_plan_parser.get_format_instructions()
-            }
-            | prompt
-            | self.llm
-            | self.action_plan_parser
-        )
-        
-        response = await chain.ainvoke({})
+        response = await self._action_plan_chain.ainvoke({"chat_history": messages})
         
         # レスポンスを辞書形式に変換
         return {
@@ -241,7 +438,7 @@ class DialogueManager:
             "summary": response.summary,
             "key_improvements": response.key_improvements,
             "metrics": response.metrics,
-            "generated_at": datetime.utcnow().isoformat()
+            "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds")
         }
     
     async def save_dialogue_state(
@@ -257,14 +454,15 @@ class DialogueManager:
         state_data = {
             "state": state,
             "metadata": metadata,
-            "updated_at": datetime.utcnow().isoformat()
+            "updated_at": datetime.now(timezone.utc).isoformat(timespec="seconds")
         }
+        self._dialogue_states[session_id] = state_data
         
         if self.memory_service.redis_client:
             await self.memory_service.redis_client.setex(
                 state_key,
                 86400,  # 24時間
-                json.dumps(state_data, ensure_ascii=False)
+                orjson.dumps(state_data)  # UTF-8のbytesをそのまま保存
             )
     
     async def get_dialogue_state(
@@ -272,12 +470,23 @@ class DialogueManager:
         session_id: str
     ) -> Optional[Dict[str, Any]]:
         """対話の状態を取得"""
+        # このプロセスで保存した状態はRedisへ問い合わせずに返す
+        cached_state = self._dialogue_states.get(session_id)
+        if cached_state is not None:
+            return cached_state
+        
         if not self.memory_service.redis_client:
             return None
         
+        # 再起動後や別ワーカーで保存された状態はRedisから取得
         state_key = f"dialogue:state:{session_id}"
         state_data = await self.memory_service.redis_client.get(state_key)
         
         if state_data:
-            return json.loads(state_data)
+            try:
+                state = orjson.loads(state_data)
+            except orjson.JSONDecodeError:
+                return None
+            self._dialogue_states[session_id] = state
+            return state
         return None
\ No newline at end of file
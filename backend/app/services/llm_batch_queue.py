@@ -0,0 +1,117 @@
+"""
+LLM呼び出しのマイクロバッチキュー
+短い時間窓で到着した呼び出しをまとめ、共有の同時実行数上限の範囲で並行送信する
+"""
+
+from typing import Any, List, Optional, Set, Tuple
+import asyncio
+import logging
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LLMBatchQueue:
+    """同時に到着したLLM呼び出しを集約するキュー
+
+    submit() で投入された入力をバックグラウンドタスクが window 秒ごとに
+    最大 max_batch 件まとめ、並行実行して結果を各呼び出し元へ返す。
+    各バッチは個別のタスクとして送信するため、送信中のバッチがあっても
+    次の入力の受け付けは止まらない。
+    同時に発行する呼び出しは、送信中の全バッチを通して max_concurrency 件までに抑える。
+    """
+
+    def __init__(
+        self,
+        llm: Any,
+        window: float = 0.01,
+        max_batch: int = 16,
+        max_concurrency: int = settings.LLM_MAX_CONCURRENCY
+    ):
+        self.llm = llm
+        self.window = window
+        self.max_batch = max_batch
+        self.max_concurrency = max_concurrency
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # 送信中のバッチ（タスクの参照を保持し、途中で破棄されないようにする）
+        self._dispatches: Set[asyncio.Task] = set()
+        # 全バッチで共有する同時実行数の上限（バッチごとの上限では合計が無制限になる）
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def _ensure_worker(self) -> asyncio.Queue:
+        """初回呼び出し時（イベントループ上）にワーカーを起動"""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        return self._queue
+
+    async def submit(self, llm_input: Any) -> Any:
+        """LLM入力を投入し、応答メッセージを待つ"""
+        queue = self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await queue.put((llm_input, future))
+        return await future
+
+    async def _run(self) -> None:
+        """キューを窓ごとに取り出し、バッチごとに送信タスクを起動"""
+        while True:
+            batch: List[Tuple[Any, asyncio.Future]] = [await self._queue.get()]
+            try:
+                await asyncio.sleep(self.window)
+            except asyncio.CancelledError:
+                self._cancel_futures(batch)
+                raise
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            # 応答を待たずに次の窓の受け付けへ戻る
+            task = asyncio.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        """1バッチを並行送信し、結果を各呼び出し元へ返す"""
+        try:
+            results = await asyncio.gather(
+                *(self._invoke(llm_input) for llm_input, _ in batch),
+                return_exceptions=True
+            )
+        except asyncio.CancelledError:
+            # 停止時に呼び出し元が応答を待ち続けないようにする
+            self._cancel_futures(batch)
+            raise
+
+        for (_, future), result in zip(batch, results, strict=True):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                logger.warning(f"LLM call in batch failed: {result!r}")
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _invoke(self, llm_input: Any) -> Any:
+        """共有の上限内でLLMを1回呼び出す"""
+        async with self._semaphore:
+            return await self.llm.ainvoke(llm_input)
+
+    @staticmethod
+    def _cancel_futures(batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        """未完了の呼び出し元をキャンセル"""
+        for _, future in batch:
+            if not future.done():
+                future.cancel()
+
+    async def aclose(self) -> None:
+        """ワーカーと送信中のバッチを停止（待機中の呼び出し元はキャンセルされる）"""
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        for task in list(self._dispatches):
+            task.cancel()
+        # キューに残った未送信の呼び出しも破棄
+        if self._queue is not None:
+            while not self._queue.empty():
+                self._cancel_futures([self._queue.get_nowait()])
@@ -0,0 +1,78 @@
+"""
+LLM応答のキャッシュ
+同一プロンプトへの応答をプロセス内（L1）とRedis（L2）に保持し、LLM呼び出しを省略する
+"""
+
+from typing import Any, List, Optional
+import hashlib
+import logging
+import re
+import unicodedata
+
+import orjson
+
+from app.services.session_store import TTLSessionStore
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_for_cache(value: Any) -> Any:
+    """キャッシュキー用に表記ゆれを吸収する
+
+    文字列はNFKC正規化（全角英数・半角カナの統一）、大文字小文字の同一視、空白の圧縮を行い、
+    「営業部」と「営業部 」、「ＩＴ」と「it」のような実質同じ入力を同じキーにまとめる。
+    """
+    if isinstance(value, str):
+        return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", value)).strip().casefold()
+    if isinstance(value, dict):
+        return {key: normalize_for_cache(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize_for_cache(item) for item in value]
+    return value
+
+
+class LLMResponseCache:
+    """プロンプト完全一致によるLLM応答キャッシュ
+
+    キーはメッセージ列をJSON化したもののblake2bハッシュ。
+    redis_client が設定されていればRedisにも `llm:cache:{hash}` として保存する。
+    """
+
+    def __init__(self, ttl: int = 86400, maxsize: int = 10000, prefix: str = "llm:cache:"):
+        self.ttl = ttl
+        self.prefix = prefix
+        self.redis_client: Optional[Any] = None
+        self._local = TTLSessionStore(maxsize=maxsize, ttl=ttl)
+
+    @staticmethod
+    def make_key(messages: List[Any]) -> str:
+        """メッセージ列からキャッシュキーを生成"""
+        payload = orjson.dumps(messages, default=lambda m: {"type": m.type, "content": m.content})
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        """キャッシュ済みの応答本文を取得"""
+        content = self._local.get(key)
+        if content is not None:
+            return content
+
+        if self.redis_client:
+            try:
+                content = await self.redis_client.get(self.prefix + key)
+            except Exception as e:
+                logger.warning(f"LLM cache lookup failed: {e}")
+                return None
+            if content is not None:
+                self._local[key] = content
+        return content
+
+    async def set(self, key: str, content: str) -> None:
+        """応答本文を保存"""
+        self._local[key] = content
+        if self.redis_client:
+            try:
+                await self.redis_client.setex(self.prefix + key, self.ttl, content)
+            except Exception as e:
+                logger.warning(f"LLM cache store failed: {e}")
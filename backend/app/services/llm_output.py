@@ -0,0 +1,220 @@
+"""
+LLM出力のパース用ユーティリティ
+"""
+
+from typing import Any, Dict, List, Optional, Type, TypeVar
+import re
+
+import orjson
+from pydantic import BaseModel, ValidationError
+
+from app.services.llm_cache import normalize_for_cache
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+# ```json ... ``` 形式（言語指定の大文字小文字・省略も許容）のコードフェンス
+_JSON_FENCE = re.compile(r"```(?:json)?\s*(\{.*?\})\s*```", re.DOTALL | re.IGNORECASE)
+# 「スコア: 73」のような数値以外を含む応答から数値（符号付き）を拾うパターン
+_SCORE_NUMBER = re.compile(r"-?\d+")
+# スコアではなく評価の尺度を表す表記（「0-100」「/100」「100点満点」「out of 100」など）
+_SCORE_SCALE = re.compile(
+    r"0\s*[-~〜～]\s*100|/\s*100|100\s*点\s*(?:満点|中)|out\s+of\s+100",
+    re.IGNORECASE
+)
+# 質問の重複判定で無視する句読点・記号
+_QUESTION_PUNCTUATION = re.compile(r"[\s?？。、,.!！「」]+")
+
+
+def extract_json_object(text: str) -> Optional[str]:
+    """テキスト中の最初のJSONオブジェクト部分を取り出す
+
+    最初の `{` から括弧の深さを数えて対応する `}` までを1パスで走査する。
+    文字列リテラル内の括弧やエスケープは無視する。見つからなければ None。
+    """
+    start = text.find("{")
+    if start == -1:
+        return None
+
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+
+def parse_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """LLM出力からJSONオブジェクトをパースする
+
+    コードフェンス内のJSONを優先し、なければ本文中の最初のJSONオブジェクトを試す。
+    いずれもパースできなければ None を返す。
+    """
+    match = _JSON_FENCE.search(text)
+    if match:
+        result = _loads_object(match.group(1))
+        if result is not None:
+            return result
+
+    extracted = extract_json_object(text)
+    if extracted is not None:
+        return _loads_object(extracted)
+    return None
+
+
+def parse_json_model(text: str, model: Type[ModelT]) -> Optional[ModelT]:
+    """LLM出力のJSONオブジェクトを直接pydanticモデルとして検証する
+
+    探索順は parse_json_object と同じ。中間の dict を作らず、
+    pydantic-core のJSONパーサーでパースと検証を1パスで行う。
+    JSONが見つからない・不正・スキーマ不一致の場合は None。
+    """
+    match = _JSON_FENCE.search(text)
+    if match:
+        result = _validate_model(match.group(1), model)
+        if result is not None:
+            return result
+
+    extracted = extract_json_object(text)
+    if extracted is not None:
+        return _validate_model(extracted, model)
+    return None
+
+
+def _validate_model(candidate: str, model: Type[ModelT]) -> Optional[ModelT]:
+    """JSON文字列をモデルとして検証し、失敗すれば None"""
+    try:
+        return model.model_validate_json(candidate)
+    except ValidationError:
+        return None
+
+
+class ArrayItemStreamParser:
+    """生成途中のJSONから、配列 `key` のうち閉じ終わった要素オブジェクトを逐次取り出す
+
+    ストリーミング中に部分的な結果を返すためのもの。feed() にチャンクを渡すと、
+    走査位置・ネストの深さ・文字列内かどうかを保持したまま新しい部分だけを走査し、
+    対応する `}` まで届いた要素をパースして返す（受信済みのテキストは再走査しない）。
+    """
+
+    def __init__(self, key: str):
+        self._marker = f'"{key}"'
+        # 配列の開始位置が見つかるまでのテキストと、次にキーを探し始める位置
+        self._head = ""
+        self._search_from = 0
+        self._found_key = False
+        self._in_array = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        # 複数チャンクにまたがる要素の断片
+        self._item_parts: List[str] = []
+        self.items: List[Dict[str, Any]] = []
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """チャンクを追加し、このチャンクで閉じ終わった要素を返す"""
+        if self._finished:
+            return []
+        if not self._found_key:
+            self._head += chunk
+            marker = self._head.find(self._marker, self._search_from)
+            if marker == -1:
+                # チャンク境界で分断されたキーも見つけられるよう末尾は再検索する
+                self._search_from = max(0, len(self._head) - len(self._marker) + 1)
+                return []
+            chunk = self._head[marker + len(self._marker):]
+            self._head = ""
+            self._found_key = True
+        if not self._in_array:
+            start = chunk.find("[")
+            if start == -1:
+                return []
+            chunk = chunk[start + 1:]
+            self._in_array = True
+        return self._scan(chunk)
+
+    def _scan(self, chunk: str) -> List[Dict[str, Any]]:
+        """配列内のテキストを走査し、閉じ終わった要素をパースする"""
+        completed: List[Dict[str, Any]] = []
+        # 前のチャンクから続く要素はチャンクの先頭から断片に含める
+        item_start = 0 if self._depth > 0 else -1
+        for i, ch in enumerate(chunk):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    item_start = i
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._item_parts.append(chunk[item_start:i + 1])
+                    item = _loads_object("".join(self._item_parts))
+                    self._item_parts.clear()
+                    if item is not None:
+                        completed.append(item)
+            elif ch == "]" and self._depth == 0:
+                self._finished = True
+                break
+
+        if self._depth > 0 and not self._finished:
+            self._item_parts.append(chunk[item_start:])
+        self.items.extend(completed)
+        return completed
+
+
+def _loads_object(candidate: str) -> Optional[Dict[str, Any]]:
+    """JSONとしてパースし、オブジェクトであれば返す"""
+    try:
+        result = orjson.loads(candidate)
+    except orjson.JSONDecodeError:
+        return None
+    return result if isinstance(result, dict) else None
+
+
+def parse_score(text: str) -> Optional[int]:
+    """LLM応答から0-100のスコアを取り出す
+
+    数値のみの応答（通常ケース）は例外を発生させずにそのまま変換する。
+    それ以外は尺度の表記（「0-100」「/100」「100点満点」など）を除いた本文中の最後の数値を使い、
+    0-100 に収める。数値がなければ None。
+    """
+    stripped = text.strip()
+    if stripped.isdecimal():
+        return min(int(stripped), 100)
+    numbers = _SCORE_NUMBER.findall(_SCORE_SCALE.sub(" ", stripped))
+    if not numbers:
+        return None
+    return max(0, min(int(numbers[-1]), 100))
+
+
+def dedupe_questions(questions: List[str]) -> List[str]:
+    """表記ゆれ（空白・句読点・全角半角・大文字小文字）だけが異なる質問を除き、出現順を保つ"""
+    unique: Dict[str, str] = {}
+    for question in questions:
+        key = _QUESTION_PUNCTUATION.sub("", normalize_for_cache(question))
+        if key and key not in unique:
+            unique[key] = question
+    return list(unique.values())
@@ -4,9 +4,79 @@ API keyなしでも動作確認可能
 """
 
 from typing import Dict, Any, List, Optional
-from datetime import datetime
-import json
+from datetime import datetime, timezone
 import random
+import re
+
+from app.services.session_store import TTLSessionStore
+
+# 充足度評価でボーナス対象となるキーワード
+BONUS_KEYWORDS = ("課題", "目標", "具体的", "例", "状況", "期限")
+# ボーナスキーワードを1回の走査で拾うためのパターン
+_BONUS_PATTERN = re.compile("|".join(map(re.escape, BONUS_KEYWORDS)))
+
+# 質問テンプレート（呼び出しごとに再構築しない）
+BASE_QUESTIONS = (
+    "どのような場面で最も困難を感じますか？",
+    "現在の営業活動で最も時間を取られていることは何ですか？",
+    "理想的な営業成果とはどのようなものですか？",
+    "過去に成功した営業事例があれば教えてください",
+    "現在利用できるリソースや制約はありますか？"
+)
+LATE_STAGE_QUESTIONS = (
+    "これまでの内容を踏まえて、最も優先したい改善点は何ですか？",
+    "具体的な期限や目標はありますか？",
+    "サポートが必要な領域を教えてください"
+)
+
+# テキスト解析のキーワードと提案
+ANALYSIS_KEYWORDS = ("営業", "コミュニケーション", "顧客", "提案", "課題", "改善")
+ANALYSIS_SUGGESTIONS = (
+    "具体的な事例を追加で聞いてみましょう",
+    "数値的な目標について確認が必要です",
+    "現在のスキルレベルを把握しましょう"
+)
+
+# アクションプランのテンプレート（モジュール読み込み時に1度だけ構築）
+ACTION_ITEM_TEMPLATES = (
+    {
+        "id": "action_1",
+        "title": "顧客コミュニケーション改善",
+        "description": "日々の顧客とのやり取りを記録し、週1回振り返りを行う",
+        "priority": "high",
+        "due_date": "2024-02-15",
+        "category": "communication",
+        "metrics": ("顧客満足度", "フォローアップ率")
+    },
+    {
+        "id": "action_2",
+        "title": "営業スキル研修参加",
+        "description": "社内外の営業研修やセミナーに月1回参加する",
+        "priority": "medium",
+        "due_date": "2024-02-29",
+        "category": "skill_development",
+        "metrics": ("研修参加回数", "学習内容の実践率")
+    },
+    {
+        "id": "action_3",
+        "title": "成果測定とレビュー",
+        "description": "月次で営業成果を数値化し、上司とレビューを行う",
+        "priority": "high",
+        "due_date": "2024-01-31",
+        "category": "measurement",
+        "metrics": ("売上目標達成率", "新規顧客獲得数")
+    }
+)
+KEY_IMPROVEMENTS = (
+    "顧客とのコミュニケーション質向上",
+    "継続的な学習習慣の確立",
+    "成果の可視化と定期レビュー"
+)
+PLAN_METRICS = {
+    "success_indicators": ("顧客満足度向上", "売上目標達成", "スキル習得"),
+    "review_frequency": "monthly",
+    "evaluation_criteria": ("定量評価", "定性評価", "自己評価")
+}
 
 
 class MockLLMProvider:
@@ -21,8 +91,7 @@ class MockLLMProvider:
         self.call_count += 1
         
         # 簡単なキーワード分析
-        keywords = ["営業", "コミュニケーション", "顧客", "提案", "課題", "改善"]
-        found_keywords = [kw for kw in keywords if kw in text]
+        found_keywords = [kw for kw in ANALYSIS_KEYWORDS if kw in text]
         
         return {
             "analysis": {
@@ -31,11 +100,7 @@ class MockLLMProvider:
                 "length": len(text),
                 "complexity": "high" if len(text) > 100 else "medium"
             },
-            "suggestions": [
-                "具体的な事例を追加で聞いてみましょう",
-                "数値的な目標について確認が必要です",
-                "現在のスキルレベルを把握しましょう"
-            ],
+            "suggestions": list(ANALYSIS_SUGGESTIONS),
             "confidence": 0.85,
             "provider": self.provider_name,
             "call_count": self.call_count
@@ -45,25 +110,13 @@ class MockLLMProvider:
         """質問生成のモック"""
         self.call_count += 1
         
-        # コンテキストに基づく質問テンプレート
-        base_questions = [
-            "どのような場面で最も困難を感じますか？",
-            "現在の営業活動で最も時間を取られていることは何ですか？",
-            "理想的な営業成果とはどのようなものですか？",
-            "過去に成功した営業事例があれば教えてください",
-            "現在利用できるリソースや制約はありますか？"
-        ]
-        
         # メッセージ数に応じて質問を調整
         message_count = context.get("message_count", 0)
         if message_count > 5:
-            questions = [
-                "これまでの内容を踏まえて、最も優先したい改善点は何ですか？",
-                "具体的な期限や目標はありますか？",
-                "サポートが必要な領域を教えてください"
-            ]
+            # 呼び出し元でリストとして扱われるため、定数はコピーして返す
+            questions = list(LATE_STAGE_QUESTIONS)
         else:
-            questions = random.sample(base_questions, min(3, len(base_questions)))
+            questions = random.sample(BASE_QUESTIONS, min(3, len(BASE_QUESTIONS)))
         
         return questions
     
@@ -72,53 +125,30 @@ class MockLLMProvider:
         self.call_count += 1
         
         # 収集された情報から基本的なプランを生成
-        messages = data.get("messages", [])
-        user_messages = [msg for msg in messages if msg.get("role") == "user"]
+        user_message_count = data.get("user_message_count")
+        if user_message_count is None:
+            messages = data.get("messages", [])
+            user_message_count = sum(1 for msg in messages if msg.get("role") == "user")
         
+        # 定数は呼び出し元で変更されても影響しないようコピーで返す
+        # （タプルで保持している入れ子の値も従来どおりリストにする）
         action_items = [
-            {
-                "id": "action_1",
-                "title": "顧客コミュニケーション改善",
-                "description": "日々の顧客とのやり取りを記録し、週1回振り返りを行う",
-                "priority": "high",
-                "due_date": "2024-02-15",
-                "category": "communication",
-                "metrics": ["顧客満足度", "フォローアップ率"]
-            },
-            {
-                "id": "action_2", 
-                "title": "営業スキル研修参加",
-                "description": "社内外の営業研修やセミナーに月1回参加する",
-                "priority": "medium",
-                "due_date": "2024-02-29",
-                "category": "skill_development",
-                "metrics": ["研修参加回数", "学習内容の実践率"]
-            },
-            {
-                "id": "action_3",
-                "title": "成果測定とレビュー",
-                "description": "月次で営業成果を数値化し、上司とレビューを行う",
-                "priority": "high",
-                "due_date": "2024-01-31",
-                "category": "measurement",
-                "metrics": ["売上目標達成率", "新規顧客獲得数"]
-            }
+            {**item, "metrics": list(item["metrics"])} for item in ACTION_ITEM_TEMPLATES
         ]
+        metrics = {
+            key: list(value) if isinstance(value, tuple) else value
+            for key, value in PLAN_METRICS.items()
+        }
         
         return {
             "action_items": action_items,
-            "summary": f"{len(user_messages)}回の対話から、営業スキル向上のための実践的なアクションプランを作成しました。",
-            "key_improvements": [
-                "顧客とのコミュニケーション質向上",
-                "継続的な学習習慣の確立", 
-                "成果の可視化と定期レビュー"
-            ],
-            "metrics": {
-                "success_indicators": ["顧客満足度向上", "売上目標達成", "スキル習得"],
-                "review_frequency": "monthly",
-                "evaluation_criteria": ["定量評価", "定性評価", "自己評価"]
-            },
-            "generated_at": datetime.utcnow().isoformat(),
+            "summary": (
+                f"{user_message_count}回の対話から、"
+                "営業スキル向上のための実践的なアクションプランを作成しました。"
+            ),
+            "key_improvements": list(KEY_IMPROVEMENTS),
+            "metrics": metrics,
+            "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
             "provider": self.provider_name,
             "call_count": self.call_count
         }
@@ -127,16 +157,23 @@ class MockLLMProvider:
         """情報充足度評価のモック"""
         self.call_count += 1
         
-        messages = context.get("messages", [])
-        user_messages = [msg for msg in messages if msg.get("role") == "user"]
+        # セッション側で集計済みの値があれば履歴を再走査しない
+        user_message_count = context.get("user_message_count")
+        matched_keywords = context.get("matched_keywords")
+        if user_message_count is None or matched_keywords is None:
+            messages = context.get("messages", [])
+            user_contents = [
+                msg.get("content", "") for msg in messages if msg.get("role") == "user"
+            ]
+            all_text = " ".join(user_contents)
+            user_message_count = len(user_contents)
+            matched_keywords = set(_BONUS_PATTERN.findall(all_text))
         
         # 簡単な評価ロジック
-        base_score = min(len(user_messages) * 15, 70)  # メッセージ数 x 15点、最大70点
+        base_score = min(user_message_count * 15, 70)  # メッセージ数 x 15点、最大70点
         
         # キーワードボーナス
-        all_text = " ".join([msg.get("content", "") for msg in user_messages])
-        bonus_keywords = ["課題", "目標", "具体的", "例", "状況", "期限"]
-        bonus = sum(5 for keyword in bonus_keywords if keyword in all_text)
+        bonus = 5 * len(matched_keywords)
         
         score = min(base_score + bonus, 100)
         return score
@@ -147,7 +184,7 @@ class MockDialogueManager:
     
     def __init__(self):
         self.llm_provider = MockLLMProvider("mock_dialogue")
-        self.sessions = {}  # セッション状態をメモリに保存
+        self.sessions = TTLSessionStore()  # セッション状態をメモリに保存（LRU + TTL）
     
     async def initialize(self):
         """初期化（何もしない）"""
@@ -164,7 +201,9 @@ class MockDialogueManager:
             "messages": [],
             "context": initial_context,
             "stage": "initial",
-            "created_at": datetime.utcnow().isoformat()
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "user_message_count": 0,
+            "matched_keywords": set()
         }
         
         # 初期質問を生成
@@ -186,27 +225,35 @@ class MockDialogueManager:
         db_session=None  # モックでは使用しない
     ) -> Dict[str, Any]:
         """ユーザー回答の処理"""
+        now_iso = datetime.now(timezone.utc).isoformat(timespec="seconds")
         if session_id not in self.sessions:
             # セッションが存在しない場合は自動的に作成
             self.sessions[session_id] = {
                 "messages": [],
                 "context": {},
                 "stage": "initial",
-                "created_at": datetime.utcnow().isoformat()
+                "created_at": now_iso,
+                "user_message_count": 0,
+                "matched_keywords": set()
             }
         
         session = self.sessions[session_id]
         
         # メッセージを追加
         session["messages"].extend([
-            {"role": "user", "content": user_response, "timestamp": datetime.utcnow().isoformat()}
+            {"role": "user", "content": user_response, "timestamp": now_iso}
         ])
+        # 回答の追加時にのみ集計を更新（毎ターンの履歴走査を避ける）
+        session["user_message_count"] += 1
+        session["matched_keywords"].update(_BONUS_PATTERN.findall(user_response))
         
         # コンテキストを更新
         context = {
             "session_id": session_id,
             "messages": session["messages"],
-            "message_count": len(session["messages"])
+            "message_count": len(session["messages"]),
+            "user_message_count": session["user_message_count"],
+            "matched_keywords": session["matched_keywords"]
         }
         
         # 情報充足度を評価
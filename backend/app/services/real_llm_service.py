@@ -3,8 +3,9 @@
 OpenAI GPT または Anthropic Claude
 """
 
-from typing import Dict, Any, List, Optional
-import json
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+from functools import lru_cache
+import re
 import asyncio
 from datetime import datetime
 
@@ -18,8 +19,57 @@ try:
 except ImportError:
     LANGCHAIN_AVAILABLE = False
 
+import orjson
 from pydantic import BaseModel, Field
 from app.core.config import settings
+from app.core.openai_client import get_shared_async_client
+from app.services.llm_cache import LLMResponseCache, normalize_for_cache
+from app.services.llm_output import ArrayItemStreamParser, parse_json_model, parse_score
+from app.services.session_store import TTLSessionStore
+
+
+# 感情分析の主要トピック判定用キーワード
+_TOPIC_KEYWORDS = {
+    "プレゼンテーション": ["プレゼン", "発表", "商談"],
+    "営業スキル": ["営業", "売上", "顧客"],
+    "コミュニケーション": ["話", "会話", "伝える"],
+    "緊張・不安": ["緊張", "不安", "真っ白"]
+}
+_KEYWORD_TO_TOPIC = {
+    keyword: topic for topic, keywords in _TOPIC_KEYWORDS.items() for keyword in keywords
+}
+
+
+def _keyword_pattern(keywords) -> "re.Pattern[str]":
+    """キーワード群を1つの正規表現にまとめ、1パスで判定できるようにする（長い語を優先）"""
+    return re.compile("|".join(map(re.escape, sorted(keywords, key=len, reverse=True))))
+
+
+_TOPIC_PATTERN = _keyword_pattern(_KEYWORD_TO_TOPIC)
+
+# 感情分析のキーワード
+_POSITIVE_PATTERN = _keyword_pattern(
+    ["成功", "良い", "できる", "学ぶ", "向上", "改善", "満足", "順調", "達成"]
+)
+_NEGATIVE_PATTERN = _keyword_pattern(
+    ["困る", "難しい", "失敗", "問題", "悩み", "不安", "苦手", "緊張", "頭が真っ白"]
+)
+_URGENT_PATTERN = _keyword_pattern(["緊急", "急", "すぐに", "至急", "明日", "今日"])
+
+# 同一プロンプトへのLLM応答（プロバイダー + メッセージ列のハッシュをキーに保持）
+_RESPONSE_CACHE = LLMResponseCache()
+
+# 同一の初期コンテキストに対する初期質問（プロバイダー + 正規化したコンテキストをキーに保持）
+_INITIAL_QUESTIONS_CACHE = TTLSessionStore(maxsize=512, ttl=3600)
+
+
+@lru_cache(maxsize=None)
+def _cached_prompt(*messages: Tuple[str, str]) -> "ChatPromptTemplate":
+    """同一のメッセージ定義からなるテンプレートはプロセス内で1度だけ構築して再利用
+
+    メッセージ定義はソース上の定数文字列なので、キーのハッシュも文字列側にキャッシュされる。
+    """
+    return ChatPromptTemplate.from_messages(list(messages))
 
 
 class QuestionGenerationResponse(BaseModel):
@@ -50,6 +100,58 @@ class RealLLMService:
         self.llm = self._initialize_llm(provider)
         self.question_parser = PydanticOutputParser(pydantic_object=QuestionGenerationResponse)
         self.action_plan_parser = PydanticOutputParser(pydantic_object=ActionPlanResponse)
+        # 充足度評価＋追加質問はツールスキーマで構造化出力させる（JSONの抽出・パースが不要）
+        self.follow_up_llm = self.llm.with_structured_output(QuestionGenerationResponse)
+        # 直近に整形した会話履歴（同じターン内の複数の呼び出しで再整形しない）
+        self._formatted_conversation: Optional[Tuple[List[Dict[str, str]], int, str, int]] = None
+    
+    def _format_conversation(
+        self,
+        conversation_history: List[Dict[str, str]]
+    ) -> Tuple[str, int]:
+        """会話履歴をプロンプト用のテキストに整形し、ユーザー発言数とともに返す
+        
+        履歴は追記のみで更新されるため、同じリストで件数も変わっていなければ
+        直前の整形結果をそのまま返す（1ターン内の評価とプラン生成で共有）。
+        """
+        cached = self._formatted_conversation
+        if (
+            cached is not None
+            and cached[0] is conversation_history
+            and cached[1] == len(conversation_history)
+        ):
+            return cached[2], cached[3]
+        
+        # 行はリストに集めて最後に1度だけ結合する（文字列の再確保を繰り返さない）
+        lines: List[str] = []
+        user_message_count = 0
+        for msg in conversation_history:
+            if msg["role"] == "user":
+                role = "ユーザー"
+                user_message_count += 1
+            else:
+                role = "AI"
+            lines.append(f"{role}: {msg['content']}\n")
+        conversation_text = "".join(lines)
+        
+        self._formatted_conversation = (
+            conversation_history, len(conversation_history), conversation_text, user_message_count
+        )
+        return conversation_text, user_message_count
+    
+    def _response_cache_key(self, messages: List[Any]) -> str:
+        """プロバイダーとメッセージ列から応答キャッシュのキーを生成"""
+        return _RESPONSE_CACHE.make_key([self.provider, *messages])
+    
+    async def _cached_ainvoke(self, messages: List[Any]) -> str:
+        """同一プロンプトの応答はキャッシュから返し、未キャッシュ時のみLLMを呼び出す"""
+        cache_key = self._response_cache_key(messages)
+        content = await _RESPONSE_CACHE.get(cache_key)
+        if content is None:
+            response = await self.llm.ainvoke(messages)
+            content = response.content
+            await _RESPONSE_CACHE.set(cache_key, content)
+        return content
     
     def _initialize_llm(self, provider: str):
         """LLMプロバイダーを初期化"""
@@ -60,7 +162,9 @@ class RealLLMService:
                 model=settings.OPENAI_MODEL,
                 temperature=0.7,
                 api_key=settings.OPENAI_API_KEY,
-                max_tokens=2000
+                max_tokens=2000,
+                # 対話マネージャーと同じ接続プール（HTTP/2）を共有する
+                http_async_client=get_shared_async_client()
             )
         elif provider == "anthropic":
             if not settings.ANTHROPIC_API_KEY:
@@ -80,7 +184,17 @@ class RealLLMService:
     ) -> QuestionGenerationResponse:
         """初期質問の生成"""
         
-        prompt = ChatPromptTemplate.from_messages([
+        # 同じ（表記ゆれを除いて同一の）初期コンテキストからの生成結果は再利用する
+        cache_key = (
+            self.provider,
+            orjson.dumps(normalize_for_cache(initial_context), option=orjson.OPT_SORT_KEYS)
+        )
+        cached = _INITIAL_QUESTIONS_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
+        initial_context_json = orjson.dumps(initial_context, option=orjson.OPT_SORT_KEYS).decode()
+        
+        prompt = _cached_prompt(
             ("system", """あなたは新人営業マンの成長を支援する専門のAIコーチです。
             営業スキル向上のアクションプラン作成に必要な質問を生成してください。
 
@@ -97,30 +211,31 @@ class RealLLMService:
             {initial_context}
             
             上記を踏まえて、JSON形式で質問を生成してください。""")
-        ])
+        )
         
-        chain = prompt | self.llm
+        # テンプレートはキャッシュ済みのため、
+        # 呼び出しごとにチェーンを組み立てずに直接メッセージ化する
+        response = await self.llm.ainvoke(
+            prompt.format_messages(initial_context=initial_context_json)
+        )
         
-        response = await chain.ainvoke({
-            "initial_context": json.dumps(initial_context, ensure_ascii=False)
-        })
+        # JSONレスポンスをパース（コードフェンスや前後の説明文は除去）
+        result = parse_json_model(response.content, QuestionGenerationResponse)
+        if result is not None:
+            _INITIAL_QUESTIONS_CACHE[cache_key] = result
+            return result
         
-        # JSONレスポンスをパース
-        try:
-            result_dict = json.loads(response.content)
-            return QuestionGenerationResponse(**result_dict)
-        except json.JSONDecodeError:
-            # JSONパースに失敗した場合のフォールバック
-            return QuestionGenerationResponse(
-                questions=[
-                    "現在の営業活動で最も困難に感じていることは何ですか？",
-                    "これまでの営業経験で成功した事例があれば教えてください",
-                    "理想的な営業成果とはどのようなものですか？"
-                ],
-                reasoning="営業スキル向上のための基本的な情報収集が必要です",
-                information_gaps=["具体的な課題", "現在のスキルレベル", "目標設定"],
-                completeness_score=20
-            )
+        # JSONパースに失敗した場合のフォールバック
+        return QuestionGenerationResponse(
+            questions=[
+                "現在の営業活動で最も困難に感じていることは何ですか？",
+                "これまでの営業経験で成功した事例があれば教えてください",
+                "理想的な営業成果とはどのようなものですか？"
+            ],
+            reasoning="営業スキル向上のための基本的な情報収集が必要です",
+            information_gaps=["具体的な課題", "現在のスキルレベル", "目標設定"],
+            completeness_score=20
+        )
     
     async def generate_follow_up_questions(
         self,
@@ -130,12 +245,9 @@ class RealLLMService:
         """フォローアップ質問の生成"""
         
         # 会話履歴を文字列に変換
-        conversation_text = ""
-        for msg in conversation_history:
-            role = "ユーザー" if msg["role"] == "user" else "AI"
-            conversation_text += f"{role}: {msg['content']}\n"
+        conversation_text, _ = self._format_conversation(conversation_history)
         
-        prompt = ChatPromptTemplate.from_messages([
+        prompt = _cached_prompt(
             ("system", """これまでの会話を分析し、追加質問をJSON形式で生成してください。
 
             以下の形式で回答してください：
@@ -143,25 +255,73 @@ class RealLLMService:
                 "questions": ["追加質問1", "追加質問2", "追加質問3"],
                 "reasoning": "なぜこれらの質問が必要か",
                 "information_gaps": ["不足情報1", "不足情報2"],
-                "completeness_score": {completeness_score}
+                "completeness_score": 現在の情報充足度
             }}"""),
+            # システムプロンプトは呼び出し間でバイト単位で同一に保ち、
+            # プロバイダー側のプレフィックスキャッシュを効かせる（可変部分はユーザーメッセージへ）
             ("user", """これまでの会話：
             {conversation_history}
             
+            現在の情報充足度：{completeness_score}
+            
             追加で必要な質問をJSON形式で生成してください。""")
-        ])
+        )
+        
+        content = await self._cached_ainvoke(prompt.format_messages(
+            conversation_history=conversation_text,
+            completeness_score=current_completeness
+        ))
+        
+        result = parse_json_model(content, QuestionGenerationResponse)
+        if result is not None:
+            return result
+        
+        return QuestionGenerationResponse(
+            questions=[
+                "より具体的な状況を教えてください",
+                "これまでに試した解決策はありますか？",
+                "期待する成果の具体的な目標はありますか？"
+            ],
+            reasoning="より詳細な情報収集が必要です",
+            information_gaps=["具体的事例", "解決策の試行錯誤", "明確な目標"],
+            completeness_score=current_completeness
+        )
+    
+    async def assess_and_generate_follow_up(
+        self,
+        conversation_history: List[Dict[str, str]]
+    ) -> QuestionGenerationResponse:
+        """情報充足度の評価とフォローアップ質問の生成を1回のLLM呼び出しで行う"""
         
-        chain = prompt | self.llm
+        # フォールバック用のユーザー発言数は会話テキスト作成と同じ走査で数える
+        conversation_text, user_message_count = self._format_conversation(conversation_history)
         
-        response = await chain.ainvoke({
-            "conversation_history": conversation_text,
-            "completeness_score": current_completeness
-        })
+        prompt = _cached_prompt(
+            ("system", """これまでの会話を分析し、営業スキル向上のアクションプラン作成に必要な
+            情報の充足度を評価したうえで、追加質問を生成してください。
+
+            充足度の評価基準（合計0-100点）：
+            - 現在の課題が具体的に特定されている（20点）
+            - 目標や期待される成果が明確（20点）
+            - 現在のスキルレベルや経験が把握できる（20点）
+            - 具体的な事例や状況が提供されている（20点）
+            - 制約条件やリソースが明確（20点）"""),
+            ("user", """これまでの会話：
+            {conversation_history}
+            
+            充足度を評価し、追加で必要な質問を生成してください。""")
+        )
         
+        # 出力形式はスキーマとしてLLMに渡されるため、プロンプトにJSON形式の指示は含めない
         try:
-            result_dict = json.loads(response.content)
-            return QuestionGenerationResponse(**result_dict)
-        except json.JSONDecodeError:
+            result = await self.follow_up_llm.ainvoke(
+                prompt.format_messages(conversation_history=conversation_text)
+            )
+            if result is None:
+                raise ValueError("Structured output not returned")
+            return result
+        except ValueError:
+            # 構造化出力が得られない場合は会話回数ベースで充足度を推定
             return QuestionGenerationResponse(
                 questions=[
                     "より具体的な状況を教えてください",
@@ -170,7 +330,7 @@ class RealLLMService:
                 ],
                 reasoning="より詳細な情報収集が必要です",
                 information_gaps=["具体的事例", "解決策の試行錯誤", "明確な目標"],
-                completeness_score=current_completeness
+                completeness_score=min(user_message_count * 15, 90)
             )
     
     async def evaluate_information_completeness(
@@ -179,12 +339,13 @@ class RealLLMService:
     ) -> int:
         """情報の充足度を評価（0-100）"""
         
-        conversation_text = ""
-        for msg in conversation_history:
-            if msg["role"] == "user":
-                conversation_text += f"ユーザー: {msg['content']}\n"
+        user_lines = [
+            f"ユーザー: {msg['content']}\n" for msg in conversation_history if msg["role"] == "user"
+        ]
+        conversation_text = "".join(user_lines)
+        user_message_count = len(user_lines)
         
-        prompt = ChatPromptTemplate.from_messages([
+        prompt = _cached_prompt(
             ("system", """営業スキル向上のアクションプラン作成に必要な情報の充足度を0-100のスコアで評価してください。
 
             評価基準：
@@ -195,18 +356,19 @@ class RealLLMService:
             - 制約条件やリソースが明確（20点）
 
             数値のみを返してください（例：75）"""),
-            ("user", f"会話内容：\n{conversation_text}")
-        ])
+            ("user", "会話内容：\n{conversation_text}")
+        )
         
-        response = await self.llm.ainvoke(prompt.format_messages())
+        # 会話内容はテンプレート変数として渡す（テンプレート自体は毎回同一）
+        content = await self._cached_ainvoke(
+            prompt.format_messages(conversation_text=conversation_text)
+        )
         
-        try:
-            score = int(response.content.strip())
-            return max(0, min(100, score))
-        except ValueError:
-            # パースエラーの場合は会話回数ベースで推定
-            user_messages = [msg for msg in conversation_history if msg["role"] == "user"]
-            return min(len(user_messages) * 15, 90)
+        score = parse_score(content)
+        if score is None:
+            # 数値が得られない場合は会話回数ベースで推定
+            return min(user_message_count * 15, 90)
+        return score
     
     async def generate_action_plan(
         self,
@@ -214,12 +376,26 @@ class RealLLMService:
     ) -> ActionPlanResponse:
         """アクションプランの生成"""
         
-        conversation_text = ""
-        for msg in conversation_history:
-            role = "ユーザー" if msg["role"] == "user" else "AI"
-            conversation_text += f"{role}: {msg['content']}\n"
+        action_plan = None
+        async for event in self.stream_action_plan(conversation_history):
+            if event["type"] == "action_plan":
+                action_plan = event["data"]
+        return action_plan
+    
+    async def stream_action_plan(
+        self,
+        conversation_history: List[Dict[str, str]]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """アクションプランをストリーミング生成
         
-        prompt = ChatPromptTemplate.from_messages([
+        受信したチャンクを {"type": "delta", "content": ...} として逐次返し、
+        アクションアイテムが1件閉じるごとに {"type": "partial", "action_items": [...]} を、
+        最後にパース済みの {"type": "action_plan", "data": ActionPlanResponse} を返す。
+        """
+        
+        conversation_text, _ = self._format_conversation(conversation_history)
+        
+        prompt = _cached_prompt(
             ("system", """会話内容からアクションプランをJSON形式で作成してください。
 
             以下の形式で回答してください：
@@ -247,39 +423,82 @@ class RealLLMService:
             {conversation_history}
             
             アクションプランをJSON形式で作成してください。""")
-        ])
+        )
         
-        chain = prompt | self.llm
+        messages = prompt.format_messages(conversation_history=conversation_text)
         
-        response = await chain.ainvoke({
-            "conversation_history": conversation_text
-        })
+        # 同一プロンプトで生成済みのプランはLLMを呼ばずに一括で返す
+        cache_key = self._response_cache_key(messages)
+        cached = await _RESPONSE_CACHE.get(cache_key)
+        if cached is not None:
+            yield {"type": "delta", "content": cached}
+            action_plan = self._try_parse_action_plan(cached) or self._fallback_action_plan()
+            yield {"type": "action_plan", "data": action_plan}
+            return
         
+        # ストリーミングで受信し、チャンクは呼び出し元へ流しつつリストに蓄積する
+        # （文字列の連結を繰り返さない）。アクションアイテムは新しいチャンクだけを走査して
+        # 取り出し、全体の結合とパースは閉じ括弧で終わるチャンクを受け取った時だけ行う。
+        # オブジェクトが閉じた時点で残りの説明文は待たずに終了する
+        chunks: List[str] = []
+        item_parser = ArrayItemStreamParser("action_items")
+        stream = self.llm.astream(messages)
         try:
-            result_dict = json.loads(response.content)
-            return ActionPlanResponse(**result_dict)
-        except json.JSONDecodeError:
-            # フォールバック
-            return ActionPlanResponse(
-                action_items=[
-                    {
-                        "id": "action_1",
-                        "title": "スキル向上研修参加",
-                        "description": "営業スキル向上のための研修に参加する",
-                        "priority": "high",
-                        "due_date": "2024-02-28",
-                        "category": "skill_development",
-                        "metrics": ["研修参加回数", "学習内容の実践率"]
-                    }
-                ],
-                summary="営業スキル向上のための基本的なアクションプラン",
-                key_focus_areas=["スキル開発", "実践経験", "継続学習"],
-                success_metrics={
-                    "success_indicators": ["スキル向上", "成果改善"],
-                    "review_frequency": "monthly"
-                },
-                timeline="3ヶ月間"
-            )
+            async for chunk in stream:
+                if not chunk.content:
+                    continue
+                chunks.append(chunk.content)
+                yield {"type": "delta", "content": chunk.content}
+                # 閉じ終わったアクションアイテムが増えていれば、完成分を先に返す
+                if item_parser.feed(chunk.content):
+                    yield {"type": "partial", "action_items": list(item_parser.items)}
+                if chunk.content.rstrip().endswith("}"):
+                    content = "".join(chunks)
+                    action_plan = self._try_parse_action_plan(content)
+                    if action_plan is not None:
+                        await _RESPONSE_CACHE.set(cache_key, content)
+                        yield {"type": "action_plan", "data": action_plan}
+                        return
+        finally:
+            await stream.aclose()
+        
+        content = "".join(chunks)
+        action_plan = self._try_parse_action_plan(content)
+        if action_plan is None:
+            action_plan = self._fallback_action_plan()
+        else:
+            await _RESPONSE_CACHE.set(cache_key, content)
+        yield {"type": "action_plan", "data": action_plan}
+    
+    @staticmethod
+    def _try_parse_action_plan(content: str) -> Optional[ActionPlanResponse]:
+        """LLM出力をアクションプランとしてパース（JSONが未完成・不正なら None）"""
+        # 前後の説明文やコードフェンスを除いたJSON部分を、dictを経由せずモデルとして検証
+        return parse_json_model(content, ActionPlanResponse)
+    
+    @staticmethod
+    def _fallback_action_plan() -> ActionPlanResponse:
+        """パースできなかった場合の基本プラン"""
+        return ActionPlanResponse(
+            action_items=[
+                {
+                    "id": "action_1",
+                    "title": "スキル向上研修参加",
+                    "description": "営業スキル向上のための研修に参加する",
+                    "priority": "high",
+                    "due_date": "2024-02-28",
+                    "category": "skill_development",
+                    "metrics": ["研修参加回数", "学習内容の実践率"]
+                }
+            ],
+            summary="営業スキル向上のための基本的なアクションプラン",
+            key_focus_areas=["スキル開発", "実践経験", "継続学習"],
+            success_metrics={
+                "success_indicators": ["スキル向上", "成果改善"],
+                "review_frequency": "monthly"
+            },
+            timeline="3ヶ月間"
+        )
     
     async def analyze_conversation_sentiment(
         self,
@@ -290,16 +509,9 @@ class RealLLMService:
         # シンプルなキーワードベース感情分析に変更（API呼び出しなし）
         # 本格運用時にはLLM APIを使用
         
-        # ポジティブキーワード
-        positive_keywords = ["成功", "良い", "できる", "学ぶ", "向上", "改善", "満足", "順調", "達成"]
-        # ネガティブキーワード  
-        negative_keywords = ["困る", "難しい", "失敗", "問題", "悩み", "不安", "苦手", "緊張", "頭が真っ白"]
-        # 緊急性キーワード
-        urgent_keywords = ["緊急", "急", "すぐに", "至急", "明日", "今日"]
-        
-        # 感情判定
-        positive_count = sum(1 for word in positive_keywords if word in user_message)
-        negative_count = sum(1 for word in negative_keywords if word in user_message)
+        # 感情判定（出現したキーワードの種類数で比較）
+        positive_count = len(set(_POSITIVE_PATTERN.findall(user_message)))
+        negative_count = len(set(_NEGATIVE_PATTERN.findall(user_message)))
         
         if negative_count > positive_count:
             sentiment = "negative"
@@ -312,20 +524,13 @@ class RealLLMService:
             emotional_state = "neutral"
         
         # 緊急性判定
-        urgency = "high" if any(word in user_message for word in urgent_keywords) else "medium"
+        urgency = "high" if _URGENT_PATTERN.search(user_message) else "medium"
         
         # 主要トピック抽出（簡易版）
-        topics = []
-        topic_keywords = {
-            "プレゼンテーション": ["プレゼン", "発表", "商談"],
-            "営業スキル": ["営業", "売上", "顧客"],
-            "コミュニケーション": ["話", "会話", "伝える"],
-            "緊張・不安": ["緊張", "不安", "真っ白"]
+        matched_topics = {
+            _KEYWORD_TO_TOPIC[match.group()] for match in _TOPIC_PATTERN.finditer(user_message)
         }
-        
-        for topic, keywords in topic_keywords.items():
-            if any(keyword in user_message for keyword in keywords):
-                topics.append(topic)
+        topics = [topic for topic in _TOPIC_KEYWORDS if topic in matched_topics]
         
         if not topics:
             topics = ["一般的な相談"]
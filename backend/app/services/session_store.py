@@ -0,0 +1,84 @@
+"""
+インメモリセッションストア
+LRU + TTL で上限とアイドル期限を設け、長時間稼働時のメモリ増加を抑える
+"""
+
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Iterator, Tuple
+import threading
+import time
+
+from app.core.config import settings
+
+
+class TTLSessionStore(MutableMapping):
+    """LRU + TTL 付きのセッション辞書
+
+    dict と同じインターフェースで扱える。アクセスされたエントリは末尾へ移動し、
+    上限超過時は最も古いエントリから O(1) で追い出す。
+    """
+
+    def __init__(
+        self,
+        maxsize: int = settings.MAX_SESSIONS,
+        ttl: float = settings.SESSION_TTL_SECONDS
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _expire(self, now: float) -> None:
+        """期限切れのエントリを先頭から削除"""
+        while self._data:
+            expires_at, _ = next(iter(self._data.values()))
+            if expires_at > now:
+                break
+            self._data.popitem(last=False)
+
+    def __getitem__(self, key: str) -> Any:
+        with self._lock:
+            now = time.monotonic()
+            expires_at, value = self._data[key]
+            if expires_at <= now:
+                del self._data[key]
+                raise KeyError(key)
+            # アクセスでTTLを延長し、LRU順を更新
+            self._data[key] = (now + self.ttl, value)
+            self._data.move_to_end(key)
+            return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            self._data[key] = (now + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __delitem__(self, key: str) -> None:
+        with self._lock:
+            del self._data[key]
+
+    def __contains__(self, key: object) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[0] > time.monotonic()
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            self._expire(time.monotonic())
+            return iter(list(self._data.keys()))
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._expire(time.monotonic())
+            return len(self._data)
+
+    def items(self):
+        """期限内のエントリを (key, value) で返す（LRU順は更新しない）"""
+        with self._lock:
+            self._expire(time.monotonic())
+            return [(key, value) for key, (_, value) in self._data.items()]
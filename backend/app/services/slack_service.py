@@ -1,18 +1,32 @@
-from typing import Dict, Any, Optional, List, Set
+from typing import Dict, Any, Optional, List
+import asyncio
 import logging
-import time
+import re
 from slack_bolt.async_app import AsyncApp
 from slack_bolt.adapter.fastapi.async_handler import AsyncSlackRequestHandler
 from app.core.config import settings
 from app.services.dialogue_manager import DialogueManager
 from app.services.conversation_memory import ConversationMemoryService
 from app.services.real_llm_service import RealLLMService
-from app.services.mock_llm import MockLLMProvider
+from app.services.mock_llm import MockLLMProvider, MockDialogueManager
+from app.services.session_store import TTLSessionStore
 
 logger = logging.getLogger(__name__)
 
+# メンション（<@BOT_ID>）除去用のパターン
+_MENTION_PATTERN = re.compile(r'<@[A-Z0-9]+>')
+
+# アクションアイテムの優先度ごとの表示絵文字（未知の優先度は low 扱い）
+_PRIORITY_EMOJI = {"high": "🔴", "medium": "🟡"}
+_DEFAULT_PRIORITY_EMOJI = "🟢"
+
 
 class SlackService:
+    # 応答待ちメッセージの最大数（超えた場合は混雑メッセージを返す）
+    MESSAGE_QUEUE_SIZE = 500
+    # メッセージを並行処理するワーカー数
+    MESSAGE_WORKERS = 4
+    
     def __init__(self):
         if not settings.SLACK_BOT_TOKEN or not settings.SLACK_SIGNING_SECRET:
             raise ValueError("Slack credentials are required")
@@ -23,15 +37,17 @@ class SlackService:
             process_before_response=True
         )
         
-        # 重複イベント防止
-        self.processed_events: Set[str] = set()
-        self.event_cleanup_time = time.time()
+        # 重複イベント防止（処理済みイベントを5分間保持、上限超過時は古いものから追い出す）
+        self.processed_events = TTLSessionStore(maxsize=10000, ttl=300)
+        
+        # メッセージ処理キュー（LLM応答を待たずにSlackへ応答するため、処理はワーカーで行う）
+        self._work_queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
         
         # LLMサービスの初期化
         if settings.USE_MOCK_LLM:
             self.llm_service = MockLLMProvider()
             # モック環境では簡単なメモリサービスを使用
-            from app.services.mock_llm import MockDialogueManager
             self.dialogue_manager = MockDialogueManager()
         else:
             self.llm_service = RealLLMService()
@@ -54,7 +70,7 @@ class SlackService:
                 if self._is_bot_message(event):
                     return
                     
-                await self._handle_message(event, say, is_mention=True)
+                await self._enqueue_message(event, say, is_mention=True)
             except Exception as e:
                 logger.error(f"Error handling app mention: {e}")
                 await say("申し訳ございません。エラーが発生しました。")
@@ -73,7 +89,7 @@ class SlackService:
                     
                 # DMのみ処理
                 if event.get("channel_type") == "im":
-                    await self._handle_message(event, say, is_mention=False)
+                    await self._enqueue_message(event, say, is_mention=False)
             except Exception as e:
                 logger.error(f"Error handling message: {e}")
                 await say("申し訳ございません。エラーが発生しました。")
@@ -94,45 +110,83 @@ class SlackService:
                 # ボット自身のユーザーIDと比較（簡易版）
                 if event.get("user").startswith("B"):  # ボットユーザーIDは通常Bで始まる
                     return True
-            except:
+            except AttributeError:
+                # user が文字列でない場合は判定しない
                 pass
         
         return False
     
     def _is_duplicate_event(self, event: Dict[str, Any]) -> bool:
         """重複イベントかどうかをチェック"""
-        # イベントの一意性チェック用のキーを生成
-        event_key = f"{event.get('ts', '')}_{event.get('user', '')}_{event.get('channel', '')}"
+        # イベントの一意性チェック用のキー（文字列の整形はせずタプルのまま使う）
+        event_key = (event.get("ts"), event.get("user"), event.get("channel"))
         
-        # 古いイベントIDをクリーンアップ（5分以上古いものは削除）
-        current_time = time.time()
-        if current_time - self.event_cleanup_time > 300:  # 5分
-            self.processed_events.clear()
-            self.event_cleanup_time = current_time
-        
-        # 重複チェック
+        # 重複チェック（期限切れのエントリは記録時に先頭から個別に削除される）
         if event_key in self.processed_events:
             return True
         
         # 新しいイベントとして記録
-        self.processed_events.add(event_key)
+        self.processed_events[event_key] = True
         return False
     
-    async def _handle_message(self, event: Dict[str, Any], say, is_mention: bool = False):
-        """メッセージ処理の共通ロジック"""
-        # 重複イベントチェック
+    def _ensure_workers(self) -> asyncio.Queue:
+        """初回呼び出し時（イベントループ上）にキューとワーカーを起動"""
+        if self._work_queue is None:
+            self._work_queue = asyncio.Queue(maxsize=self.MESSAGE_QUEUE_SIZE)
+        self._workers = [worker for worker in self._workers if not worker.done()]
+        while len(self._workers) < self.MESSAGE_WORKERS:
+            self._workers.append(asyncio.create_task(self._worker_loop()))
+        return self._work_queue
+    
+    async def _enqueue_message(self, event: Dict[str, Any], say, is_mention: bool = False):
+        """メッセージを処理キューに投入してすぐに戻る
+        
+        Slackは3秒以内の応答を求めるため、LLMを使う処理はワーカーに任せ、
+        イベントハンドラーは投入だけ行って応答（ack）させる。
+        """
+        # 重複イベント（Slackの再送を含む）はキューに入れない
         if self._is_duplicate_event(event):
             logger.info(f"Duplicate event detected, skipping: {event.get('ts')}")
             return
         
+        queue = self._ensure_workers()
+        try:
+            queue.put_nowait((event, say, is_mention))
+        except asyncio.QueueFull:
+            logger.warning(f"Slack message queue is full, rejecting event: {event.get('ts')}")
+            await say("ただいま混み合っています。少し時間をおいてから再度お試しください。")
+    
+    async def _worker_loop(self):
+        """キューからメッセージを取り出して処理"""
+        while True:
+            event, say, is_mention = await self._work_queue.get()
+            try:
+                await self._handle_message(event, say, is_mention=is_mention)
+            except Exception as e:
+                logger.error(f"Error processing Slack message: {e}")
+                try:
+                    await say("申し訳ございません。エラーが発生しました。")
+                except Exception as say_error:
+                    logger.error(f"Failed to send error message to Slack: {say_error}")
+            finally:
+                self._work_queue.task_done()
+    
+    async def aclose(self):
+        """ワーカーを停止"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+    
+    async def _handle_message(self, event: Dict[str, Any], say, is_mention: bool = False):
+        """メッセージ処理の共通ロジック"""
         user_id = event.get("user")
         text = event.get("text", "")
         
         # メンションの場合はBot IDを除去
         if is_mention:
             # <@BOT_ID>を除去
-            import re
-            text = re.sub(r'<@[A-Z0-9]+>', '', text).strip()
+            text = _MENTION_PATTERN.sub('', text).strip()
         
         if not text:
             await say("メッセージが空です。何かご質問はありますか？")
@@ -161,44 +215,47 @@ class SlackService:
     
     def _format_questions_for_slack(self, questions: List[str], completeness_score: int) -> str:
         """質問をSlack用にフォーマット"""
-        formatted = f"📊 情報収集進捗: {completeness_score}%\n\n"
-        formatted += "以下の点について詳しく教えてください：\n"
+        # 各行はリストに集めて最後に1度だけ結合する
+        lines = [
+            f"📊 情報収集進捗: {completeness_score}%\n\n",
+            "以下の点について詳しく教えてください：\n"
+        ]
+        lines.extend(f"{i}. {question}\n" for i, question in enumerate(questions, 1))
         
-        for i, question in enumerate(questions, 1):
-            formatted += f"{i}. {question}\n"
-        
-        if len(formatted) > 3000:
-            formatted = formatted[:2900] + "\n\n_（続きがあります）_"
-        
-        return formatted
+        return self._truncate_for_slack("".join(lines))
     
     def _format_action_plan_for_slack(self, action_plan: Dict, completeness_score: int) -> str:
         """アクションプランをSlack用にフォーマット"""
-        formatted = f"🎯 **営業成長アクションプラン** (完了度: {completeness_score}%)\n\n"
-        formatted += f"📝 **概要**\n{action_plan.get('summary', '')}\n\n"
+        lines = [
+            f"🎯 **営業成長アクションプラン** (完了度: {completeness_score}%)\n\n",
+            f"📝 **概要**\n{action_plan.get('summary', '')}\n\n"
+        ]
         
         # アクションアイテム
         action_items = action_plan.get('action_items', [])
         if action_items:
-            formatted += "📋 **具体的アクション**\n"
+            lines.append("📋 **具体的アクション**\n")
             for item in action_items:
-                priority_emoji = "🔴" if item.get('priority') == 'high' else "🟡" if item.get('priority') == 'medium' else "🟢"
-                formatted += f"{priority_emoji} **{item.get('title', '')}**\n"
-                formatted += f"   └ {item.get('description', '')}\n"
+                priority_emoji = _PRIORITY_EMOJI.get(item.get('priority'), _DEFAULT_PRIORITY_EMOJI)
+                lines.append(f"{priority_emoji} **{item.get('title', '')}**\n")
+                lines.append(f"   └ {item.get('description', '')}\n")
                 if item.get('due_date'):
-                    formatted += f"   📅 期限: {item.get('due_date')}\n"
-                formatted += "\n"
+                    lines.append(f"   📅 期限: {item.get('due_date')}\n")
+                lines.append("\n")
         
         # 主要改善ポイント
         key_improvements = action_plan.get('key_improvements', [])
         if key_improvements:
-            formatted += "🎯 **重点改善項目**\n"
-            for improvement in key_improvements:
-                formatted += f"• {improvement}\n"
+            lines.append("🎯 **重点改善項目**\n")
+            lines.extend(f"• {improvement}\n" for improvement in key_improvements)
         
+        return self._truncate_for_slack("".join(lines))
+    
+    @staticmethod
+    def _truncate_for_slack(formatted: str) -> str:
+        """Slackの表示上限を超える場合は末尾を省略"""
         if len(formatted) > 3000:
             formatted = formatted[:2900] + "\n\n_（続きがあります）_"
-        
         return formatted
     
     async def get_handler(self):
@@ -214,4 +271,10 @@ def get_slack_service() -> SlackService:
     global slack_service
     if slack_service is None:
         slack_service = SlackService()
-    return slack_service
\ No newline at end of file
+    return slack_service
+
+
+async def close_slack_service() -> None:
+    """SlackServiceのワーカーを停止（アプリケーション終了時に呼び出す）"""
+    if slack_service is not None:
+        await slack_service.aclose()
\ No newline at end of file
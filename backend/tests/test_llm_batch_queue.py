@@ -0,0 +1,124 @@
+"""
+LLMBatchQueue のテスト
+"""
+
+import asyncio
+from types import SimpleNamespace
+from typing import Dict, Optional
+
+import pytest
+
+from app.services.llm_batch_queue import LLMBatchQueue
+
+
+class FakeLLM:
+    """入力ごとの待ち時間・例外を指定できるLLMの代替"""
+
+    def __init__(
+        self,
+        delays: Optional[Dict[str, float]] = None,
+        errors: Optional[Dict[str, Exception]] = None
+    ):
+        self.delays = delays or {}
+        self.errors = errors or {}
+        self.active = 0
+        self.peak = 0
+        self.calls = []
+
+    async def ainvoke(self, llm_input: str) -> SimpleNamespace:
+        self.calls.append(llm_input)
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delays.get(llm_input, 0.01))
+            if llm_input in self.errors:
+                raise self.errors[llm_input]
+            return SimpleNamespace(content=f"reply:{llm_input}")
+        finally:
+            self.active -= 1
+
+
+async def test_each_caller_receives_its_own_result():
+    """同じバッチにまとめられても、結果は各呼び出し元へ対応して返る"""
+    llm = FakeLLM()
+    queue = LLMBatchQueue(llm, window=0.01)
+
+    inputs = [f"q{i}" for i in range(5)]
+    results = await asyncio.gather(*(queue.submit(x) for x in inputs))
+
+    assert [r.content for r in results] == [f"reply:{x}" for x in inputs]
+    await queue.aclose()
+
+
+async def test_max_batch_splits_large_bursts():
+    """max_batch を超える同時投入も全件処理される"""
+    llm = FakeLLM()
+    queue = LLMBatchQueue(llm, window=0.01, max_batch=2)
+
+    results = await asyncio.gather(*(queue.submit(f"q{i}") for i in range(5)))
+
+    assert len(results) == 5
+    assert sorted(llm.calls) == [f"q{i}" for i in range(5)]
+    await queue.aclose()
+
+
+async def test_failure_is_isolated_to_its_caller():
+    """1件の失敗は同じバッチの他の呼び出し元に影響しない"""
+    llm = FakeLLM(errors={"bad": ValueError("boom")})
+    queue = LLMBatchQueue(llm, window=0.01)
+
+    ok, bad = await asyncio.gather(
+        queue.submit("ok"), queue.submit("bad"), return_exceptions=True
+    )
+
+    assert ok.content == "reply:ok"
+    assert isinstance(bad, ValueError)
+    await queue.aclose()
+
+
+async def test_slow_batch_does_not_block_next_window():
+    """送信中のバッチが遅くても、次の窓の呼び出しは先に完了する"""
+    llm = FakeLLM(delays={"slow": 0.5})
+    queue = LLMBatchQueue(llm, window=0.01)
+
+    slow = asyncio.create_task(queue.submit("slow"))
+    await asyncio.sleep(0.05)
+    fast = await asyncio.wait_for(queue.submit("fast"), timeout=0.3)
+
+    assert fast.content == "reply:fast"
+    assert not slow.done()
+    assert (await slow).content == "reply:slow"
+    await queue.aclose()
+
+
+async def test_concurrency_limit_is_shared_across_batches():
+    """同時実行数の上限はバッチごとではなく送信中の全バッチで共有される"""
+    llm = FakeLLM(delays={f"q{i}": 0.1 for i in range(6)})
+    queue = LLMBatchQueue(llm, window=0.01, max_batch=2, max_concurrency=2)
+
+    tasks = []
+    for i in range(6):
+        tasks.append(asyncio.create_task(queue.submit(f"q{i}")))
+        # 別々の窓に入るよう間隔を空けて投入
+        await asyncio.sleep(0.02)
+    await asyncio.gather(*tasks)
+
+    assert llm.peak == 2
+    await queue.aclose()
+
+
+async def test_aclose_cancels_waiting_callers():
+    """停止時、送信中・未送信の呼び出し元は待ち続けずにキャンセルされる"""
+    llm = FakeLLM(delays={"in_flight": 1.0})
+    queue = LLMBatchQueue(llm, window=0.01)
+
+    in_flight = asyncio.create_task(queue.submit("in_flight"))
+    await asyncio.sleep(0.05)
+    windowed = asyncio.create_task(queue.submit("windowed"))
+    await asyncio.sleep(0)
+
+    await queue.aclose()
+
+    for task in (in_flight, windowed):
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(task, timeout=0.5)
@@ -0,0 +1,82 @@
+"""
+LLM出力パーサーのテスト
+"""
+
+import pytest
+
+from app.services.llm_output import ArrayItemStreamParser, parse_score
+
+STREAMED_PLAN = (
+    'プランです。\n```json\n{"action_items": ['
+    '{"id": "action_1", "title": "括弧 } と \\" を含む"}, '
+    '{"id": "action_2", "metrics": {"target": [1, 2]}},'
+    '{"id": "action_3"}'
+    '], "summary": "{要約}", "other": [{"id": "ignored"}]}\n```'
+)
+EXPECTED_ITEMS = [
+    {"id": "action_1", "title": '括弧 } と " を含む'},
+    {"id": "action_2", "metrics": {"target": [1, 2]}},
+    {"id": "action_3"},
+]
+
+
+def feed_in_chunks(text: str, size: int) -> ArrayItemStreamParser:
+    parser = ArrayItemStreamParser("action_items")
+    for start in range(0, len(text), size):
+        parser.feed(text[start:start + size])
+    return parser
+
+
+@pytest.mark.parametrize("size", range(1, len(STREAMED_PLAN) + 1))
+def test_stream_parser_is_independent_of_chunk_boundaries(size):
+    """キー・文字列・要素がチャンク境界で分断されても同じ結果になる"""
+    assert feed_in_chunks(STREAMED_PLAN, size).items == EXPECTED_ITEMS
+
+
+def test_stream_parser_returns_only_newly_completed_items():
+    parser = ArrayItemStreamParser("action_items")
+
+    assert parser.feed('{"action_items": [{"id": "a"}, {"id"') == [{"id": "a"}]
+    assert parser.feed(': "b"') == []
+    assert parser.feed('}]}') == [{"id": "b"}]
+    assert parser.items == [{"id": "a"}, {"id": "b"}]
+
+
+def test_stream_parser_ignores_text_after_array_end():
+    parser = ArrayItemStreamParser("action_items")
+    parser.feed('{"action_items": [], "more": [{"id": "x"}]}')
+
+    assert parser.feed('{"id": "y"}') == []
+    assert parser.items == []
+
+
+def test_stream_parser_without_key_returns_nothing():
+    parser = ArrayItemStreamParser("action_items")
+
+    assert parser.feed('{"items": [{"id": "a"}]}') == []
+    assert parser.items == []
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        ("73", 73),
+        (" 85\n", 85),
+        ("150", 100),
+        ("スコア: 73", 73),
+        ("73/100", 73),
+        ("73 / 100点", 73),
+        ("スコア: 73点（100点満点）", 73),
+        ("100点中73点", 73),
+        ("73 out of 100", 73),
+        ("0-100で評価すると73", 73),
+        ("0〜100で評価: 73", 73),
+        ("100/100", 100),
+        ("-5", 0),
+        ("スコア: -5", 0),
+        ("評価できません", None),
+        ("", None),
+    ],
+)
+def test_parse_score(text, expected):
+    assert parse_score(text) == expected
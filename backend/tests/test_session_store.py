@@ -0,0 +1,99 @@
+"""
+TTLSessionStore のテスト
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import session_store
+from app.services.session_store import TTLSessionStore
+
+
+class FakeClock:
+    """time.monotonic の代わりに手動で進める時計"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(session_store, "time", SimpleNamespace(monotonic=fake.monotonic))
+    return fake
+
+
+def test_entry_expires_after_ttl(clock):
+    store = TTLSessionStore(maxsize=10, ttl=60)
+    store["a"] = 1
+
+    clock.advance(59)
+    assert store["a"] == 1
+
+    clock.advance(61)
+    assert "a" not in store
+    assert store.get("a") is None
+    assert len(store) == 0
+
+
+def test_access_extends_ttl(clock):
+    store = TTLSessionStore(maxsize=10, ttl=60)
+    store["a"] = 1
+
+    clock.advance(50)
+    assert store["a"] == 1
+    clock.advance(50)
+
+    assert store["a"] == 1
+
+
+def test_contains_does_not_extend_ttl(clock):
+    store = TTLSessionStore(maxsize=10, ttl=60)
+    store["a"] = 1
+
+    clock.advance(50)
+    assert "a" in store
+    clock.advance(20)
+
+    assert "a" not in store
+
+
+def test_lru_eviction_drops_least_recently_used(clock):
+    store = TTLSessionStore(maxsize=2, ttl=60)
+    store["a"] = 1
+    store["b"] = 2
+
+    # a を参照して最近使用に更新すると、追加時には b が追い出される
+    assert store["a"] == 1
+    store["c"] = 3
+
+    assert "b" not in store
+    assert store["a"] == 1
+    assert store["c"] == 3
+    assert len(store) == 2
+
+
+def test_tuple_keys_and_pop(clock):
+    store = TTLSessionStore(maxsize=10, ttl=60)
+    store[("session", 2000)] = "memory"
+
+    assert store.pop(("session", 2000)) == "memory"
+    assert store.pop(("session", 2000), None) is None
+
+
+def test_items_skips_expired_entries(clock):
+    store = TTLSessionStore(maxsize=10, ttl=60)
+    store["old"] = 1
+    clock.advance(30)
+    store["new"] = 2
+    clock.advance(40)
+
+    assert store.items() == [("new", 2)]
+    assert list(store) == ["new"]